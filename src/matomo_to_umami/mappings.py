@@ -1,17 +1,34 @@
-"""Field mappings between Matomo and Umami schemas."""
+"""Field mappings between Matomo and Umami schemas.
 
+The public tables are read-only views; the per-row lookups use private
+plain dicts built from them.
+"""
+
+import hashlib
 import uuid
+from collections.abc import Iterable, Mapping
 from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Final
 from urllib.parse import urlparse
 
 # Matomo URL prefix mapping
-URL_PREFIXES: Final[dict[int, str]] = {
-    0: "",  # Legacy - domain included in name, no protocol
-    1: "http://",
-    2: "https://",
-    3: "https://www.",
-}
+URL_PREFIXES: Final[Mapping[int, str]] = MappingProxyType(
+    {
+        0: "",  # Legacy - domain included in name, no protocol
+        1: "http://",
+        2: "https://",
+        3: "https://www.",
+    }
+)
+
+# URL_PREFIXES indexed by prefix ID, with the part of each prefix that
+# belongs to the host ("www." for prefix 3)
+_URL_PREFIX_BY_ID: Final[tuple[tuple[str, str], ...]] = tuple(
+    (URL_PREFIXES[prefix_id], URL_PREFIXES[prefix_id].partition("://")[2])
+    for prefix_id in range(len(URL_PREFIXES))
+)
 
 # Matomo action types
 ACTION_TYPE_URL: Final[int] = 1
@@ -32,171 +49,189 @@ ACTION_TYPE_CONTENT_INTERACTION: Final[int] = 16
 
 # Matomo device type mapping to Umami device names
 # Umami only has: desktop, laptop, mobile, tablet, unknown
-DEVICE_TYPES: Final[dict[int, str]] = {
-    0: "desktop",
-    1: "mobile",  # smartphone
-    2: "tablet",
-    3: "mobile",  # feature phone
-    4: "desktop",  # console
-    5: "desktop",  # tv
-    6: "desktop",  # car browser
-    7: "desktop",  # smart display
-    8: "desktop",  # camera
-    9: "mobile",  # portable media player
-    10: "mobile",  # phablet
-    11: "desktop",  # smart speaker
-    12: "mobile",  # wearable
-    13: "desktop",  # peripheral
-}
+DEVICE_TYPES: Final[Mapping[int, str]] = MappingProxyType(
+    {
+        0: "desktop",
+        1: "mobile",  # smartphone
+        2: "tablet",
+        3: "mobile",  # feature phone
+        4: "desktop",  # console
+        5: "desktop",  # tv
+        6: "desktop",  # car browser
+        7: "desktop",  # smart display
+        8: "desktop",  # camera
+        9: "mobile",  # portable media player
+        10: "mobile",  # phablet
+        11: "desktop",  # smart speaker
+        12: "mobile",  # wearable
+        13: "desktop",  # peripheral
+    }
+)
 
 # Matomo browser codes to Umami browser names
 # Reference: https://github.com/matomo-org/device-detector
 # Only browsers with icons in Umami (public/images/browser/) are mapped
 # Unrecognized browsers will be mapped to "unknown"
-BROWSER_MAPPING: Final[dict[str, str]] = {
-    # Major browsers
-    "CH": "chrome",
-    "CR": "chrome",  # Chromium
-    "FF": "firefox",
-    "SF": "safari",
-    "IE": "ie",
-    "ED": "edge",
-    "OP": "opera",
-    # Mobile variants (map to base browser or specific mobile icon)
-    "CM": "chrome",  # Chrome Mobile
-    "CI": "crios",  # Chrome iOS
-    "FM": "firefox",  # Firefox Mobile
-    "MF": "firefox",  # Firefox Mobile
-    "FI": "fxios",  # Firefox iOS
-    "SM": "safari",  # Safari Mobile
-    "AN": "android",  # Android Browser
-    "SB": "samsung",  # Samsung Browser
-    "MI": "miui",  # MIUI Browser
-    # Firefox-based browsers (map to firefox)
-    "PS": "firefox",  # Pale Moon
-    "F1": "firefox",  # Firefox Focus
-    "FK": "firefox",  # Firefox Klar
-    "WA": "firefox",  # Waterfox
-    "LB": "firefox",  # LibreWolf
-    "FL": "firefox",  # Floorp
-    "TH": "firefox",  # Tor Browser
-    # Chromium-based browsers (map to chrome)
-    "VI": "chrome",  # Vivaldi
-    "AR": "chrome",  # Arc
-    "DU": "chrome",  # DuckDuckGo
-    "CC": "chrome",  # Coc Coc
-    "CO": "chrome",  # CoolNovo
-    "IR": "chrome",  # Iron
-    "CD": "chrome",  # Comodo Dragon
-    "UR": "chrome",  # Ur Browser
-    "WH": "chrome",  # Whale
-    # Opera-based browsers (also Chromium-based)
-    "OM": "opera",  # Opera Mobile
-    # Alternative browsers (only those with Umami icons)
-    "BR": "brave",
-    "YA": "yandexbrowser",
-    "OI": "opera-mini",
-    "SI": "silk",  # Amazon Silk
-    "BB": "blackberry",
-    "AO": "aol",
-    "KT": "kakaotalk",
-    "CU": "curl",
-    # WebViews and embedded
-    "CW": "chromium-webview",
-    "CV": "chromium-webview",
-    "WV": "android-webview",
-    "AW": "android-webview",
-    "IW": "ios-webview",
-    "FB": "facebook",
-    "IG": "instagram",
-    # Headless/Automation (map to base browser)
-    "HC": "chrome",  # Headless Chrome
-    "PP": "chrome",  # Puppeteer (uses Chromium)
-    # Edge variants
-    "EI": "edge-ios",
-    "EC": "edge-chromium",
-}
+BROWSER_MAPPING: Final[Mapping[str, str]] = MappingProxyType(
+    {
+        # Major browsers
+        "CH": "chrome",
+        "CR": "chrome",  # Chromium
+        "FF": "firefox",
+        "SF": "safari",
+        "IE": "ie",
+        "ED": "edge",
+        "OP": "opera",
+        # Mobile variants (map to base browser or specific mobile icon)
+        "CM": "chrome",  # Chrome Mobile
+        "CI": "crios",  # Chrome iOS
+        "FM": "firefox",  # Firefox Mobile
+        "MF": "firefox",  # Firefox Mobile
+        "FI": "fxios",  # Firefox iOS
+        "SM": "safari",  # Safari Mobile
+        "AN": "android",  # Android Browser
+        "SB": "samsung",  # Samsung Browser
+        "MI": "miui",  # MIUI Browser
+        # Firefox-based browsers (map to firefox)
+        "PS": "firefox",  # Pale Moon
+        "F1": "firefox",  # Firefox Focus
+        "FK": "firefox",  # Firefox Klar
+        "WA": "firefox",  # Waterfox
+        "LB": "firefox",  # LibreWolf
+        "FL": "firefox",  # Floorp
+        "TH": "firefox",  # Tor Browser
+        # Chromium-based browsers (map to chrome)
+        "VI": "chrome",  # Vivaldi
+        "AR": "chrome",  # Arc
+        "DU": "chrome",  # DuckDuckGo
+        "CC": "chrome",  # Coc Coc
+        "CO": "chrome",  # CoolNovo
+        "IR": "chrome",  # Iron
+        "CD": "chrome",  # Comodo Dragon
+        "UR": "chrome",  # Ur Browser
+        "WH": "chrome",  # Whale
+        # Opera-based browsers (also Chromium-based)
+        "OM": "opera",  # Opera Mobile
+        # Alternative browsers (only those with Umami icons)
+        "BR": "brave",
+        "YA": "yandexbrowser",
+        "OI": "opera-mini",
+        "SI": "silk",  # Amazon Silk
+        "BB": "blackberry",
+        "AO": "aol",
+        "KT": "kakaotalk",
+        "CU": "curl",
+        # WebViews and embedded
+        "CW": "chromium-webview",
+        "CV": "chromium-webview",
+        "WV": "android-webview",
+        "AW": "android-webview",
+        "IW": "ios-webview",
+        "FB": "facebook",
+        "IG": "instagram",
+        # Headless/Automation (map to base browser)
+        "HC": "chrome",  # Headless Chrome
+        "PP": "chrome",  # Puppeteer (uses Chromium)
+        # Edge variants
+        "EI": "edge-ios",
+        "EC": "edge-chromium",
+    }
+)
 
 # Matomo OS codes to Umami OS names
 # Reference: https://github.com/matomo-org/device-detector
 # Umami uses detect-browser which returns values like "Windows 10", "Android OS", etc.
 # These get converted to image paths: "Windows 10" -> windows-10.png
-OS_MAPPING: Final[dict[str, str]] = {
-    # Desktop OS - Windows variants
-    "WIN": "Windows 10",
-    "WI7": "Windows 7",
-    "W81": "Windows 8.1",
-    "W10": "Windows 10",
-    "WI1": "Windows 10",  # Windows 11 uses Windows 10 icon
-    "WXP": "Windows XP",
-    "WVI": "Windows Vista",
-    "WME": "Windows ME",
-    "W98": "Windows 98",
-    "W95": "Windows 95",
-    "W2K": "Windows 2000",
-    "W31": "Windows 3.11",
-    "WS3": "Windows Server 2003",
-    # Other desktop OS
-    "MAC": "Mac OS",
-    "LIN": "Linux",
-    "COS": "Chrome OS",
-    # Mobile OS
-    "AND": "Android OS",
-    "IOS": "iOS",
-    "IPA": "iOS",  # iPad
-    "IPH": "iOS",  # iPhone
-    "WPH": "Windows Mobile",
-    "WMO": "Windows Mobile",
-    "WRT": "Windows Mobile",  # Windows RT
-    "WCE": "Windows CE",
-    "BLB": "BlackBerry OS",
-    "SYM": "Linux",  # Symbian - no icon
-    "WEB": "Linux",  # webOS - no icon
-    "KAI": "Linux",  # KaiOS - no icon
-    "HAR": "Android OS",  # HarmonyOS - closest is Android
-    "FUC": "Linux",  # Fuchsia - no icon
-    "FOS": "Linux",  # Firefox OS
-    # Linux distributions (all map to Linux)
-    "UBT": "Linux",  # Ubuntu
-    "FED": "Linux",  # Fedora
-    "DEB": "Linux",  # Debian
-    "MIN": "Linux",  # Mint
-    "ARC": "Linux",  # Arch
-    "CEN": "Linux",  # CentOS
-    "RHL": "Linux",  # Red Hat
-    "SUS": "Linux",  # SUSE
-    "GEN": "Linux",  # Gentoo
-    "MAN": "Linux",  # Manjaro
-    "ELE": "Linux",  # Elementary
-    "POP": "Linux",  # Pop!_OS
-    # BSD variants
-    "BSD": "Linux",  # Generic BSD
-    "FRE": "Linux",  # FreeBSD
-    "OPE": "Open BSD",  # OpenBSD
-    "NET": "Linux",  # NetBSD
-    # Gaming consoles
-    "PS3": "Linux",  # PlayStation 3
-    "PS4": "Linux",  # PlayStation 4
-    "PS5": "Linux",  # PlayStation 5
-    "XB1": "Linux",  # Xbox One
-    "XBX": "Linux",  # Xbox
-    "WII": "Linux",  # Wii
-    "NDS": "Linux",  # Nintendo DS
-    # Other
-    "AMZ": "Amazon OS",  # Fire OS
-    "TIZ": "Linux",  # Tizen
-    "ROS": "Linux",  # Robot OS
-    "HAI": "Linux",  # Haiku
-    "OBS": "Linux",  # Other BSD
-    "SOS": "Sun OS",
-    "QNX": "QNX",
-    "BEO": "BeOS",
-    "OS2": "OS/2",
-    "UNK": "Linux",  # Unknown defaults to Linux (shows icon)
-}
-
-
-@dataclass
+OS_MAPPING: Final[Mapping[str, str]] = MappingProxyType(
+    {
+        # Desktop OS - Windows variants
+        "WIN": "Windows 10",
+        "WI7": "Windows 7",
+        "W81": "Windows 8.1",
+        "W10": "Windows 10",
+        "WI1": "Windows 10",  # Windows 11 uses Windows 10 icon
+        "WXP": "Windows XP",
+        "WVI": "Windows Vista",
+        "WME": "Windows ME",
+        "W98": "Windows 98",
+        "W95": "Windows 95",
+        "W2K": "Windows 2000",
+        "W31": "Windows 3.11",
+        "WS3": "Windows Server 2003",
+        # Other desktop OS
+        "MAC": "Mac OS",
+        "LIN": "Linux",
+        "COS": "Chrome OS",
+        # Mobile OS
+        "AND": "Android OS",
+        "IOS": "iOS",
+        "IPA": "iOS",  # iPad
+        "IPH": "iOS",  # iPhone
+        "WPH": "Windows Mobile",
+        "WMO": "Windows Mobile",
+        "WRT": "Windows Mobile",  # Windows RT
+        "WCE": "Windows CE",
+        "BLB": "BlackBerry OS",
+        "SYM": "Linux",  # Symbian - no icon
+        "WEB": "Linux",  # webOS - no icon
+        "KAI": "Linux",  # KaiOS - no icon
+        "HAR": "Android OS",  # HarmonyOS - closest is Android
+        "FUC": "Linux",  # Fuchsia - no icon
+        "FOS": "Linux",  # Firefox OS
+        # Linux distributions (all map to Linux)
+        "UBT": "Linux",  # Ubuntu
+        "FED": "Linux",  # Fedora
+        "DEB": "Linux",  # Debian
+        "MIN": "Linux",  # Mint
+        "ARC": "Linux",  # Arch
+        "CEN": "Linux",  # CentOS
+        "RHL": "Linux",  # Red Hat
+        "SUS": "Linux",  # SUSE
+        "GEN": "Linux",  # Gentoo
+        "MAN": "Linux",  # Manjaro
+        "ELE": "Linux",  # Elementary
+        "POP": "Linux",  # Pop!_OS
+        # BSD variants
+        "BSD": "Linux",  # Generic BSD
+        "FRE": "Linux",  # FreeBSD
+        "OPE": "Open BSD",  # OpenBSD
+        "NET": "Linux",  # NetBSD
+        # Gaming consoles
+        "PS3": "Linux",  # PlayStation 3
+        "PS4": "Linux",  # PlayStation 4
+        "PS5": "Linux",  # PlayStation 5
+        "XB1": "Linux",  # Xbox One
+        "XBX": "Linux",  # Xbox
+        "WII": "Linux",  # Wii
+        "NDS": "Linux",  # Nintendo DS
+        # Other
+        "AMZ": "Amazon OS",  # Fire OS
+        "TIZ": "Linux",  # Tizen
+        "ROS": "Linux",  # Robot OS
+        "HAI": "Linux",  # Haiku
+        "OBS": "Linux",  # Other BSD
+        "SOS": "Sun OS",
+        "QNX": "QNX",
+        "BEO": "BeOS",
+        "OS2": "OS/2",
+        "UNK": "Linux",  # Unknown defaults to Linux (shows icon)
+    }
+)
+
+# Lookups used by the map_* functions, with missing codes (NULL or empty)
+# folded in so a mapping is a single dict probe
+_BROWSER_LOOKUP: Final[dict[str | None, str | None]] = dict(
+    [(None, None), ("", None), *BROWSER_MAPPING.items()]
+)
+_OS_LOOKUP: Final[dict[str | None, str | None]] = dict(
+    [(None, None), ("", None), *OS_MAPPING.items()]
+)
+_DEVICE_LOOKUP: Final[dict[int | None, str | None]] = dict(
+    [(None, None), *DEVICE_TYPES.items()]
+)
+
+
+@dataclass(frozen=True, slots=True)
 class SiteMapping:
     """Maps a Matomo site to an Umami website."""
 
@@ -205,46 +240,163 @@ class SiteMapping:
     domain: str
 
 
-def generate_uuid_from_matomo_id(matomo_id: int, prefix: str) -> str:
+# Namespace for generated UUIDs; changing it would change every migrated ID
+UUID_NAMESPACE: Final[uuid.UUID] = uuid.UUID("6ba7b810-9dad-11d1-80b4-00c04fd430c8")
+
+# SHA-1 state after hashing the namespace and the constant "matomo:" name prefix
+_UUID_NAME_HASH = hashlib.sha1(UUID_NAMESPACE.bytes + b"matomo:")
+
+# Hex digit of the UUID clock sequence once the RFC 4122 variant bits are set
+_UUID_VARIANT_DIGIT: Final[dict[str, str]] = {
+    digit: "89ab"[int(digit, 16) & 3] for digit in "0123456789abcdef"
+}
+
+
+def _format_uuid5(digest: str) -> str:
+    """Format a SHA-1 hex digest as a version 5 UUID string."""
+    return (
+        f"{digest[:8]}-{digest[8:12]}-5{digest[13:16]}-"
+        f"{_UUID_VARIANT_DIGIT[digest[16]]}{digest[17:20]}-{digest[20:32]}"
+    )
+
+
+def generate_uncached_uuid_from_matomo_id(matomo_id: int, prefix: str) -> str:
     """Generate a deterministic UUID from a Matomo integer ID.
 
-    Uses UUID v5 with a namespace to ensure consistent mapping.
+    Uses UUID v5 with a namespace to ensure consistent mapping. Equivalent to
+    uuid5(UUID_NAMESPACE, f"matomo:{prefix}:{matomo_id}"), but resumes from the
+    precomputed hash of the constant prefix and formats the digest directly.
+    """
+    name_hash = _UUID_NAME_HASH.copy()
+    name_hash.update(f"{prefix}:{matomo_id}".encode())
+    return _format_uuid5(name_hash.hexdigest())
+
+
+@lru_cache(maxsize=65536)
+def generate_uuid_from_matomo_id(matomo_id: int, prefix: str) -> str:
+    """Cached generate_uncached_uuid_from_matomo_id.
+
+    Visit IDs repeat across all the events of a visit, so their UUIDs are
+    worth caching.
+    """
+    return generate_uncached_uuid_from_matomo_id(matomo_id, prefix)
+
+
+def _urlparse_parts(url: str) -> tuple[str, str, str]:
+    """Split a URL into (netloc, path, query) with urlparse."""
+    parsed = urlparse(url)
+    return parsed.netloc, parsed.path, parsed.query
+
+
+def _split_http_url(url: str, start: int) -> tuple[str, str, str] | None:
+    """Split url[start:], what follows an http(s) "://", into (netloc, path, query).
+
+    Follows urlparse using plain str.find scans. Returns None when the URL
+    needs urlparse's special handling (IPv6 brackets, tab/newline removal,
+    non-ASCII hosts).
+    """
+    end = url.find("#", start)
+    if end < 0:
+        end = len(url)
+    query_start = url.find("?", start, end)
+    path_end = query_start if query_start >= 0 else end
+    netloc_end = url.find("/", start, path_end)
+    if netloc_end < 0:
+        netloc_end = path_end
+
+    netloc = url[start:netloc_end]
+    if (
+        "[" in netloc
+        or "]" in netloc
+        or not netloc.isascii()
+        or "\t" in url
+        or "\r" in url
+        or "\n" in url
+    ):
+        return None
+
+    path = url[netloc_end:path_end]
+    if ";" in path:
+        # Parameters of the last path segment are not part of the path
+        params_start = path.find(";", path.rfind("/"))
+        if params_start >= 0:
+            path = path[:params_start]
+    query = url[query_start + 1 : end] if query_start >= 0 else ""
+    return netloc, path, query
+
+
+def _split_url(url: str) -> tuple[str, str, str]:
+    """Split a URL into (netloc, path, query), as urlparse would."""
+    scheme_end = url.find("://")
+    if 0 <= scheme_end and url[:scheme_end].lower() in ("http", "https"):
+        parts = _split_http_url(url, scheme_end + 3)
+        if parts is not None:
+            return parts
+    return _urlparse_parts(url)
+
+
+def _split_prefixed_url(
+    prefix: str, host_prefix: str, rest: str
+) -> tuple[str, str, str]:
+    """Split prefix + rest like _split_url, without building the joined URL.
+
+    prefix is an http(s) scheme with "://" and host_prefix the part of it
+    after "://", which becomes the start of the netloc.
+    """
+    parts = _split_http_url(rest, 0)
+    if parts is None:
+        return _urlparse_parts(prefix + rest)
+    netloc, path, query = parts
+    return host_prefix + netloc, path, query
+
+
+def generate_uuids_from_matomo_ids(matomo_ids: Iterable[int], prefix: str) -> list[str]:
+    """Generate the UUIDs of many Matomo IDs of the same kind at once.
+
+    Same results as generate_uuid_from_matomo_id, for IDs that are each seen
+    once (visits in the session scan, actions in the event scan) and would
+    only churn its cache. The prefix is hashed once for the whole batch.
     """
-    namespace = uuid.UUID("6ba7b810-9dad-11d1-80b4-00c04fd430c8")  # URL namespace
-    name = f"matomo:{prefix}:{matomo_id}"
-    return str(uuid.uuid5(namespace, name))
+    prefix_hash = _UUID_NAME_HASH.copy()
+    prefix_hash.update(f"{prefix}:".encode())
+    new_hash = prefix_hash.copy
 
+    uuids = []
+    for matomo_id in matomo_ids:
+        name_hash = new_hash()
+        name_hash.update(str(matomo_id).encode())
+        uuids.append(_format_uuid5(name_hash.hexdigest()))
+    return uuids
 
+
+@lru_cache(maxsize=65536)
 def parse_matomo_url(name: str, url_prefix: int | None) -> tuple[str, str, str | None]:
     """Parse Matomo URL into hostname, path, and query string.
 
+    Matomo stores each distinct URL once in piwik_log_action, so the same
+    (name, url_prefix) pairs come back for many events and are cached.
+
     Returns (hostname, path, query) tuple.
     """
-    if url_prefix is None:
-        url_prefix = 0
-
-    prefix = URL_PREFIXES.get(url_prefix, "")
-
     # Reconstruct full URL for parsing
     # Prefix 0 means domain is in name without protocol
     # BUT outlinks/downloads store full URL with protocol in name (prefix NULL/0)
-    if url_prefix == 0:
+    if not url_prefix:
         # Check if name already has a protocol
         if name.startswith(("http://", "https://")):
-            full_url = name
+            hostname, path, query = _split_url(name)
         else:
-            full_url = "https://" + name
+            hostname, path, query = _split_prefixed_url("https://", "", name)
+    elif 0 < url_prefix < len(_URL_PREFIX_BY_ID):
+        prefix, host_prefix = _URL_PREFIX_BY_ID[url_prefix]
+        hostname, path, query = _split_prefixed_url(prefix, host_prefix, name)
     else:
-        full_url = prefix + name
-
-    parsed = urlparse(full_url)
-    hostname = parsed.netloc or ""
-    path = parsed.path or "/"
-    query = parsed.query or None
+        hostname, path, query = _split_url(name)
 
-    return hostname, path, query
+    return hostname, path or "/", query or None
 
 
+@lru_cache(maxsize=65536)
 def parse_referrer_url(
     referer_url: str | None,
 ) -> tuple[str | None, str | None, str | None]:
@@ -255,19 +407,17 @@ def parse_referrer_url(
     if not referer_url:
         return None, None, None
 
-    # Add protocol if missing for urlparse to work correctly
-    if "://" not in referer_url:
-        referer_url = "https://" + referer_url
-
-    parsed = urlparse(referer_url)
-    domain = parsed.netloc or None
+    # Referrers without a protocol are parsed as https://{referer_url}
+    if "://" in referer_url:
+        netloc, path, query = _split_url(referer_url)
+    else:
+        netloc, path, query = _split_prefixed_url("https://", "", referer_url)
+    domain = netloc or None
     # Strip www. prefix to match Umami's normalization
     if domain and domain.startswith("www."):
         domain = domain[4:]
-    path = parsed.path or "/"
-    query = parsed.query or None
 
-    return domain, path, query
+    return domain, path or "/", query or None
 
 
 def map_browser(matomo_code: str | None) -> str | None:
@@ -276,9 +426,7 @@ def map_browser(matomo_code: str | None) -> str | None:
     Only returns browser names that Umami recognizes (has icons for).
     Unrecognized browsers are mapped to "unknown".
     """
-    if not matomo_code:
-        return None
-    return BROWSER_MAPPING.get(matomo_code, "unknown")
+    return _BROWSER_LOOKUP.get(matomo_code, "unknown")
 
 
 def map_os(matomo_code: str | None) -> str | None:
@@ -287,20 +435,15 @@ def map_os(matomo_code: str | None) -> str | None:
     Returns OS names matching detect-browser format (e.g., "Windows 10", "Android OS").
     Unrecognized OS codes default to "Linux" (has icon).
     """
-    if not matomo_code:
-        return None
-    return OS_MAPPING.get(matomo_code, "Linux")
+    return _OS_LOOKUP.get(matomo_code, "Linux")
 
 
 def map_device_type(matomo_type: int | None) -> str | None:
     """Map Matomo device type to Umami device name."""
-    if matomo_type is None:
-        return None
-    return DEVICE_TYPES.get(matomo_type, "desktop")
+    return _DEVICE_LOOKUP.get(matomo_type, "desktop")
 
 
 def truncate_field(value: str | None, max_length: int) -> str | None:
     """Truncate a field to max length for Umami schema compatibility."""
-    if value is None:
-        return None
-    return value[:max_length] if len(value) > max_length else value
+    # Slicing a shorter string returns it unchanged, so no length check
+    return value if value is None else value[:max_length]
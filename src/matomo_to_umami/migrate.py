@@ -4,17 +4,23 @@ from __future__ import annotations
 
 import argparse
 import logging
+import queue
 import re
+import shutil
 import sys
+import threading
 from collections.abc import Generator
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, TextIO
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, BinaryIO, Final, TextIO
 
 import mysql.connector
 from mysql.connector import Error as MySQLError
 from mysql.connector.connection import MySQLConnection
-from mysql.connector.cursor import MySQLCursorDict
+from mysql.connector.cursor import MySQLCursor
 from rich.console import Console
 from rich.logging import RichHandler
 from rich.progress import (
@@ -30,13 +36,14 @@ from rich.table import Table
 
 from .mappings import (
     SiteMapping,
+    generate_uncached_uuid_from_matomo_id,
     generate_uuid_from_matomo_id,
+    generate_uuids_from_matomo_ids,
     map_browser,
     map_device_type,
     map_os,
     parse_matomo_url,
     parse_referrer_url,
-    truncate_field,
 )
 from .region_mappings import convert_region_to_iso
 
@@ -56,6 +63,59 @@ class WhereClause:
         )
 
 
+@dataclass(frozen=True)
+class TableSpec:
+    """Describes an Umami table rows are written to."""
+
+    name: str
+    columns: str
+    conflict_column: str
+
+
+SESSION_TABLE = TableSpec(
+    name="session",
+    columns="session_id, website_id, browser, os, device, screen, language, country, region, city, created_at, distinct_id",
+    conflict_column="session_id",
+)
+WEBSITE_EVENT_TABLE = TableSpec(
+    name="website_event",
+    columns="event_id, website_id, session_id, created_at, url_path, url_query, referrer_path, referrer_query, referrer_domain, page_title, event_type, event_name, visit_id, tag, hostname",
+    conflict_column="event_id",
+)
+EVENT_DATA_TABLE = TableSpec(
+    name="event_data",
+    columns="event_data_id, website_id, website_event_id, data_key, string_value, number_value, date_value, data_type, created_at",
+    conflict_column="event_data_id",
+)
+
+# Map Matomo action type to Umami event_type and event_name
+# Matomo: 1=pageview, 2=outlink, 3=download
+# Umami: event_type 1=pageview, 2=custom event
+EVENT_TYPES: Final[dict[int, tuple[int, str | None]]] = {
+    1: (1, None),
+    2: (2, "outlink"),
+    3: (2, "download"),
+}
+
+# MySQL DATE_FORMAT pattern matching datetime.isoformat() for DATETIME
+# columns (no fractional seconds). %S is seconds: the connector would
+# substitute a lowercase %s as a query parameter.
+ISO_DATETIME_FORMAT: Final = "%Y-%m-%dT%H:%i:%S"
+
+
+def iso_datetime_sql(column: str) -> str:
+    """SQL expression formatting a DATETIME column as an ISO 8601 string.
+
+    Zero and partly zero dates (0000-00-00 00:00:00, 2023-00-10) give NULL,
+    as mysql.connector returns None for them: PostgreSQL would reject the
+    formatted value and abort the import.
+    """
+    return (
+        f"IF(YEAR({column}) = 0 OR MONTH({column}) = 0 OR DAY({column}) = 0, "
+        f"NULL, DATE_FORMAT({column}, '{ISO_DATETIME_FORMAT}'))"
+    )
+
+
 console = Console(stderr=True)
 logger = logging.getLogger(__name__)
 
@@ -98,9 +158,17 @@ class SiteMappingError(MigrationError):
     pass
 
 
+UMAMI_UUID_PATTERN: Final = re.compile(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE
+)
+
+
+@lru_cache(maxsize=128)
 def validate_site_mapping(mapping_str: str) -> SiteMapping:
     """Parse and validate a site mapping string.
 
+    Results are cached; SiteMapping is frozen, so sharing them is safe.
+
     Args:
         mapping_str: Format "matomo_id:umami_uuid:domain"
 
@@ -110,36 +178,30 @@ def validate_site_mapping(mapping_str: str) -> SiteMapping:
     Raises:
         SiteMappingError: If the mapping string is invalid
     """
-    parts = mapping_str.split(":")
-
-    if len(parts) < 3:
+    # A UUID has no colons, so a valid mapping has exactly two
+    if mapping_str.count(":") != 2:
         raise SiteMappingError(
             f"Invalid site mapping format: '{mapping_str}'\n"
             f"Expected format: matomo_id:umami_uuid:domain\n"
             f"Example: 1:550e8400-e29b-41d4-a716-446655440000:example.com"
         )
 
+    matomo_id_str, umami_uuid, domain = mapping_str.split(":")
+
     # Parse matomo_id
     try:
-        matomo_id = int(parts[0])
+        matomo_id = int(matomo_id_str)
         if matomo_id <= 0:
             raise SiteMappingError(
-                f"Invalid Matomo site ID: '{parts[0]}' (must be a positive integer)"
+                f"Invalid Matomo site ID: '{matomo_id_str}' (must be a positive integer)"
             )
     except ValueError:
         raise SiteMappingError(
-            f"Invalid Matomo site ID: '{parts[0]}' (must be an integer)"
+            f"Invalid Matomo site ID: '{matomo_id_str}' (must be an integer)"
         )
 
-    # Handle UUID which contains colons - rejoin all parts except first and last
-    domain = parts[-1]
-    umami_uuid = ":".join(parts[1:-1])
-
     # Validate UUID format
-    uuid_pattern = re.compile(
-        r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.IGNORECASE
-    )
-    if not uuid_pattern.match(umami_uuid):
+    if not UMAMI_UUID_PATTERN.fullmatch(umami_uuid):
         raise SiteMappingError(
             f"Invalid Umami UUID: '{umami_uuid}'\n"
             f"Expected format: xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"
@@ -171,25 +233,207 @@ def escape_sql_string(value: str | None, max_length: int | None = None) -> str:
     if value is None:
         return "NULL"
     # Truncate before escaping if max_length specified
-    if max_length is not None and len(value) > max_length:
+    if max_length is not None:
         value = value[:max_length]
     # Only escape single quotes (backslashes are literal in standard SQL)
     escaped = value.replace("'", "''")
     return f"'{escaped}'"
 
 
-def format_timestamp(dt: datetime | None) -> str:
-    """Format datetime for PostgreSQL."""
-    if dt is None:
+def format_timestamp(timestamp: str | None) -> str:
+    """Format an ISO 8601 timestamp string for PostgreSQL."""
+    if timestamp is None:
         return "NULL"
-    return f"'{dt.isoformat()}'"
+    return f"'{timestamp}'"
+
+
+# A \. line inside a multi-line value. psql ends COPY FROM STDIN data at any
+# line that is exactly \., without regard to CSV quoting.
+_COPY_END_OF_DATA_LINE: Final = re.compile(r"(?<=\n)\\\.(?=\r?\n)")
+
+
+def escape_csv_field(value: str | None, max_length: int | None = None) -> str:
+    """Escape a string as a CSV field for PostgreSQL COPY.
+
+    Values are always quoted: this keeps empty strings distinct from NULL
+    (an unquoted empty field) and keeps a value of just \\. from ending the
+    data. Quoting does not protect a \\. line after an embedded newline, as
+    psql ends the data there before parsing the CSV, so such lines are
+    emptied.
+    """
+    if value is None:
+        return ""
+    if max_length is not None:
+        value = value[:max_length]
+    if "\n\\." in value:
+        value = _COPY_END_OF_DATA_LINE.sub("", value)
+    escaped = value.replace('"', '""')
+    return f'"{escaped}"'
+
+
+def format_csv_timestamp(timestamp: str | None) -> str:
+    """Format an ISO 8601 timestamp string as a CSV field for PostgreSQL COPY."""
+    if timestamp is None:
+        return ""
+    return timestamp
+
+
+class SqlInsertFormat:
+    """Renders rows as batched INSERT ... VALUES statements."""
+
+    null = "NULL"
+    text = staticmethod(escape_sql_string)
+    timestamp = staticmethod(format_timestamp)
+
+    @staticmethod
+    def row(values: tuple[str, ...]) -> str:
+        """Render one row of already formatted values."""
+        return f"({', '.join(values)})"
+
+    def start(self, table: TableSpec) -> str | None:
+        """Statement to emit before the first batch of a table, if any."""
+        return None
+
+    def batch(self, table: TableSpec, rows: list[str]) -> str:
+        """Render a batch of rows."""
+        return f"""INSERT INTO {table.name} ({table.columns})
+VALUES
+{",".join(rows)}
+ON CONFLICT ({table.conflict_column}) DO NOTHING;
+"""
+
+    def finish(self, table: TableSpec) -> str | None:
+        """Statement to emit after the last batch of a table, if any."""
+        return None
+
+
+class CopyFormat(SqlInsertFormat):
+    """Renders rows as CSV COPY blocks, for psql scripts.
+
+    COPY cannot skip rows that already exist, so rows are copied into a
+    temporary staging table and moved over with INSERT ... ON CONFLICT.
+    """
+
+    null = ""
+    text = staticmethod(escape_csv_field)
+    timestamp = staticmethod(format_csv_timestamp)
+    row = staticmethod(",".join)
+
+    def start(self, table: TableSpec) -> str | None:
+        return (
+            f"CREATE TEMP TABLE {table.name}_import "
+            f"(LIKE {table.name} INCLUDING DEFAULTS) ON COMMIT DROP;\n"
+        )
+
+    def batch(self, table: TableSpec, rows: list[str]) -> str:
+        data = "\n".join(rows)
+        return f"""COPY {table.name}_import ({table.columns}) FROM STDIN WITH (FORMAT csv);
+{data}
+\\.
+"""
+
+    def finish(self, table: TableSpec) -> str | None:
+        return f"""INSERT INTO {table.name} ({table.columns})
+SELECT {table.columns} FROM {table.name}_import
+ON CONFLICT ({table.conflict_column}) DO NOTHING;
+"""
+
+
+OUTPUT_FORMATS: Final[dict[str, SqlInsertFormat]] = {
+    "sql": SqlInsertFormat(),
+    "copy": CopyFormat(),
+}
+
+
+class CompressedWriter:
+    """Text writer that zstd-compresses into a binary file.
+
+    Writes are gathered into chunks that a background thread encodes,
+    compresses and writes out, so SQL generation carries on while the
+    previous chunk is being compressed (zstd releases the GIL).
+    """
+
+    CHUNK_SIZE: int = 1024 * 1024
+
+    def __init__(self, raw: BinaryIO, level: int = 3) -> None:
+        # Stdlib since Python 3.14, only needed with --compress
+        from compression import zstd
+
+        self._raw = raw
+        self._compressor = zstd.ZstdCompressor(level=level)
+        self._pending: list[str] = []
+        self._pending_size = 0
+        self._chunks: queue.Queue[str | None] = queue.Queue(maxsize=64)
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while (chunk := self._chunks.get()) is not None:
+            # Keep draining after a failure so the producer never blocks
+            if self._error is None:
+                try:
+                    self._raw.write(self._compressor.compress(chunk.encode()))
+                except BaseException as e:
+                    self._error = e
+
+    def _submit(self) -> None:
+        if self._error is not None:
+            raise self._error
+        if self._pending:
+            self._chunks.put("".join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def write(self, text: str) -> int:
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= self.CHUNK_SIZE:
+            self._submit()
+        return len(text)
+
+    def flush(self) -> None:
+        """Hand buffered text to the compression thread."""
+        self._submit()
+
+    def close(self) -> None:
+        """Compress what is left, end the zstd frame and close the file.
+
+        The file is closed even when compressing or writing failed, and the
+        error is then raised.
+        """
+        try:
+            try:
+                self._submit()
+            finally:
+                self._chunks.put(None)
+                self._thread.join()
+            if self._error is not None:
+                raise self._error
+            self._raw.write(self._compressor.flush())
+        finally:
+            self._raw.close()
 
 
 class MatomoToUmamiMigrator:
     """Handles migration from Matomo to Umami."""
 
+    # Maximum number of piwik_log_action entries kept by the event caches
+    ACTION_CACHE_SIZE: int = 100_000
+
+    # Run once per connection. The session is only ever read from, and as
+    # autocommit is off every query runs in one REPEATABLE READ snapshot, so
+    # the counts match the rows streamed afterwards. The long streaming
+    # queries can stall on our side (slow disk, busy progress bar), so give
+    # the server more than the default 60s before it drops the connection.
+    SESSION_SETUP: tuple[str, ...] = (
+        "SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY",
+        "SET SESSION net_write_timeout = 3600",
+        "SET SESSION net_read_timeout = 3600",
+    )
+
     conn: MySQLConnection
-    cursor: MySQLCursorDict
+    cursor: MySQLCursor
 
     def __init__(
         self,
@@ -200,6 +444,8 @@ class MatomoToUmamiMigrator:
         mysql_database: str = "matomo",
         site_mappings: list[SiteMapping] | None = None,
         batch_size: int = 1000,
+        output_format: str = "sql",
+        compress: bool = False,
     ) -> None:
         self.mysql_config: dict[str, Any] = {
             "host": mysql_host,
@@ -207,9 +453,15 @@ class MatomoToUmamiMigrator:
             "user": mysql_user,
             "password": mysql_password,
             "database": mysql_database,
+            # The cursor streams rows from the server; discard the unread
+            # rest of a result when its generator is not run to the end
+            "consume_results": True,
         }
         self.site_mappings: list[SiteMapping] = site_mappings or []
         self.batch_size: int = batch_size
+        self.output_format: str = output_format
+        self.output: SqlInsertFormat = OUTPUT_FORMATS[output_format]
+        self.compress: bool = compress
         self._site_map: dict[int, SiteMapping] = {
             m.matomo_idsite: m for m in self.site_mappings
         }
@@ -225,7 +477,11 @@ class MatomoToUmamiMigrator:
         )
         try:
             self.conn = mysql.connector.connect(**self.mysql_config)
-            self.cursor = self.conn.cursor(dictionary=True)
+            # Plain tuple rows: the row loops unpack them positionally,
+            # which skips building a dict for every row
+            self.cursor = self.conn.cursor()
+            for statement in self.SESSION_SETUP:
+                self.cursor.execute(statement)
             logger.info("Successfully connected to MySQL database")
         except MySQLError as e:
             error_code = e.errno if hasattr(e, "errno") else "unknown"
@@ -259,6 +515,48 @@ class MatomoToUmamiMigrator:
         """Get Umami website ID for a Matomo site ID."""
         return self._site_map.get(idsite)
 
+    def _website_id_literals(self) -> dict[int, str]:
+        """Map Matomo site IDs to their formatted Umami website ID value.
+
+        Built once per query so the row loops skip the per-row formatting.
+        """
+        return {
+            idsite: self.output.text(mapping.umami_website_id)
+            for idsite, mapping in self._site_map.items()
+        }
+
+    @staticmethod
+    def _advance(progress: Progress | None, task_id: TaskID | None, rows: int) -> None:
+        """Advance the progress bar by a whole batch of rows at once."""
+        if progress and task_id is not None:
+            progress.advance(task_id, rows)
+
+    def _site_id_list(self) -> str:
+        """Comma-separated site IDs, inlined into the SQL.
+
+        Site IDs are validated integers, so they are safe to inline; a
+        literal IN list lets MySQL plan an index range scan on idsite.
+        """
+        return ", ".join(str(m.matomo_idsite) for m in self.site_mappings)
+
+    def _event_index_hint(
+        self,
+        start_date: datetime | None,
+        end_date: datetime | None,
+    ) -> str:
+        """Index hint for scans of piwik_log_link_visit_action.
+
+        Only given when a date range narrows the scan: it then pins the plan
+        to Matomo's (idsite, server_time) index, which covers both the site
+        and the date filter. For a full-history scan the optimizer chooses,
+        as forcing the secondary index there would sort the whole joined
+        result for ORDER BY idlink_va before streaming the first row, and
+        look up every row by primary key.
+        """
+        if self.site_mappings and (start_date or end_date):
+            return "FORCE INDEX (index_idsite_servertime)"
+        return ""
+
     def _build_session_where(
         self,
         start_date: datetime | None,
@@ -277,10 +575,7 @@ class MatomoToUmamiMigrator:
         params: list[Any] = []
 
         if self.site_mappings:
-            site_ids = tuple(m.matomo_idsite for m in self.site_mappings)
-            placeholders = ", ".join(["%s"] * len(site_ids))
-            where_parts.append(f"v.idsite IN ({placeholders})")
-            params.extend(site_ids)
+            where_parts.append(f"v.idsite IN ({self._site_id_list()})")
 
         if start_date is not None:
             where_parts.append("v.visit_first_action_time >= %s")
@@ -310,10 +605,7 @@ class MatomoToUmamiMigrator:
         params: list[Any] = []
 
         if self.site_mappings:
-            site_ids = tuple(m.matomo_idsite for m in self.site_mappings)
-            placeholders = ", ".join(["%s"] * len(site_ids))
-            where_parts.append(f"lva.idsite IN ({placeholders})")
-            params.extend(site_ids)
+            where_parts.append(f"lva.idsite IN ({self._site_id_list()})")
 
         if start_date is not None:
             where_parts.append("lva.server_time >= %s")
@@ -335,7 +627,7 @@ class MatomoToUmamiMigrator:
         query = f"SELECT COUNT(*) as cnt FROM piwik_log_visit v WHERE {where.sql}"
         self.cursor.execute(query, where.params)
         result = self.cursor.fetchone()
-        count: int = result["cnt"] if result else 0
+        count: int = result[0] if result else 0
         logger.debug(f"Found {count:,} sessions to migrate")
         return count
 
@@ -348,7 +640,7 @@ class MatomoToUmamiMigrator:
         where = self._build_event_where(start_date, end_date)
         query = f"""
             SELECT COUNT(*) as cnt
-            FROM piwik_log_link_visit_action lva
+            FROM piwik_log_link_visit_action lva {self._event_index_hint(start_date, end_date)}
             JOIN piwik_log_action url_action ON lva.idaction_url = url_action.idaction
             WHERE {where.sql}
               AND lva.idaction_url IS NOT NULL
@@ -356,7 +648,7 @@ class MatomoToUmamiMigrator:
         """
         self.cursor.execute(query, where.params)
         result = self.cursor.fetchone()
-        count: int = result["cnt"] if result else 0
+        count: int = result[0] if result else 0
         logger.debug(f"Found {count:,} events to migrate")
         return count
 
@@ -378,8 +670,8 @@ class MatomoToUmamiMigrator:
         result = self.cursor.fetchone()
         if result:
             return {
-                "min_date": result["min_date"],
-                "max_date": result["max_date"],
+                "min_date": result[0],
+                "max_date": result[1],
             }
         return {"min_date": None, "max_date": None}
 
@@ -410,7 +702,7 @@ class MatomoToUmamiMigrator:
             """
             self.cursor.execute(query, extra_where.params)
             result = self.cursor.fetchone()
-            site_sessions: int = result["cnt"] if result else 0
+            site_sessions: int = result[0] if result else 0
 
             event_where = self._build_event_where(start_date, end_date)
             extra_where = event_where.with_extra_condition(
@@ -418,14 +710,15 @@ class MatomoToUmamiMigrator:
                 mapping.matomo_idsite,
             )
             query = f"""
-                SELECT COUNT(*) as cnt FROM piwik_log_link_visit_action lva
+                SELECT COUNT(*) as cnt
+                FROM piwik_log_link_visit_action lva {self._event_index_hint(start_date, end_date)}
                 JOIN piwik_log_action url_action ON lva.idaction_url = url_action.idaction
                 WHERE {extra_where.sql}
                   AND url_action.type IN (1, 2, 3)
             """
             self.cursor.execute(query, extra_where.params)
             result = self.cursor.fetchone()
-            site_events: int = result["cnt"] if result else 0
+            site_events: int = result[0] if result else 0
 
             site_breakdown.append(
                 {
@@ -498,20 +791,21 @@ class MatomoToUmamiMigrator:
         """Generate SQL INSERT statements for sessions."""
         where = self._build_session_where(start_date, end_date)
 
+        # Column order must match the row unpacking below
         query = f"""
             SELECT
                 v.idvisit,
                 v.idsite,
-                v.idvisitor,
-                v.visit_first_action_time,
+                {iso_datetime_sql("v.visit_first_action_time")}
+                    AS visit_first_action_time,
                 v.config_browser_name,
                 v.config_os,
                 v.config_device_type,
-                v.config_resolution,
-                v.location_browser_lang,
-                v.location_country,
+                LEFT(v.config_resolution, 11) AS config_resolution,
+                LEFT(v.location_browser_lang, 35) AS location_browser_lang,
+                UPPER(LEFT(v.location_country, 2)) AS location_country,
                 v.location_region,
-                v.location_city
+                LEFT(v.location_city, 50) AS location_city
             FROM piwik_log_visit v
             WHERE {where.sql}
             ORDER BY v.idvisit
@@ -523,70 +817,85 @@ class MatomoToUmamiMigrator:
         yield "-- Maps to Umami session table"
         yield ""
 
+        fmt = self.output
+        website_ids = self._website_id_literals()
+
+        start = fmt.start(SESSION_TABLE)
+        if start:
+            yield start
+
         batch = []
-        for row in self.cursor:
-            mapping = self.get_site_mapping(row["idsite"])
-            if not mapping:
-                continue
-
-            session_id = generate_uuid_from_matomo_id(row["idvisit"], "visit")
-
-            # Map fields
-            browser = truncate_field(map_browser(row["config_browser_name"]), 20)
-            os = truncate_field(map_os(row["config_os"]), 20)
-            device = truncate_field(map_device_type(row["config_device_type"]), 20)
-            screen = truncate_field(row["config_resolution"], 11)
-            language = truncate_field(row["location_browser_lang"], 35)
-            country = (
-                row["location_country"][:2].upper() if row["location_country"] else None
+        # Rows are fetched in blocks so their UUIDs are generated together
+        while rows := self.cursor.fetchmany(self.batch_size):
+            session_ids = generate_uuids_from_matomo_ids(
+                (row[0] for row in rows), "visit"
             )
-            # Region should be in {country}-{region} format for Umami
-            # Convert FIPS region codes to ISO 3166-2
-            raw_region = row["location_region"]
-            if raw_region and country:
-                iso_region = convert_region_to_iso(country, raw_region)
-                if "-" not in iso_region:
-                    region = f"{country}-{iso_region}"
+            for (
+                (
+                    idvisit,
+                    idsite,
+                    first_action_time,
+                    browser_name,
+                    os_name,
+                    device_type,
+                    screen,
+                    language,
+                    country,
+                    raw_region,
+                    city,
+                ),
+                session_id,
+            ) in zip(rows, session_ids):
+                website_id = website_ids.get(idsite)
+                if not website_id:
+                    continue
+
+                # Map fields (mapped names always fit Umami's 20 char columns;
+                # free-form columns are already truncated by the query)
+                browser = map_browser(browser_name)
+                os = map_os(os_name)
+                device = map_device_type(device_type)
+                country = country or None
+                # Region should be in {country}-{region} format for Umami
+                # Convert FIPS region codes to ISO 3166-2, sliced to fit
+                # Umami's 20 char column
+                if raw_region and country:
+                    iso_region = convert_region_to_iso(country, raw_region)
+                    if "-" not in iso_region:
+                        region = f"{country}-{iso_region}"[:20]
+                    else:
+                        region = iso_region[:20]
                 else:
-                    region = iso_region
-            else:
-                region = None
-            region = truncate_field(region, 20)
-            city = truncate_field(row["location_city"], 50)
-
-            values = (
-                f"'{session_id}'",
-                f"'{mapping.umami_website_id}'",
-                escape_sql_string(browser),
-                escape_sql_string(os),
-                escape_sql_string(device),
-                escape_sql_string(screen),
-                escape_sql_string(language),
-                escape_sql_string(country),
-                escape_sql_string(region),
-                escape_sql_string(city),
-                format_timestamp(row["visit_first_action_time"]),
-                "NULL",  # distinct_id
-            )
-            batch.append(f"({', '.join(values)})")
-
-            if progress and task_id is not None:
-                progress.advance(task_id)
+                    region = None
+
+                values = (
+                    fmt.text(session_id),
+                    website_id,
+                    fmt.text(browser),
+                    fmt.text(os),
+                    fmt.text(device),
+                    fmt.text(screen),
+                    fmt.text(language),
+                    fmt.text(country),
+                    fmt.text(region),
+                    fmt.text(city),
+                    fmt.timestamp(first_action_time),
+                    fmt.null,  # distinct_id
+                )
+                batch.append(fmt.row(values))
 
-            if len(batch) >= self.batch_size:
-                yield self._format_session_insert(batch)
-                batch = []
+                if len(batch) >= self.batch_size:
+                    yield fmt.batch(SESSION_TABLE, batch)
+                    self._advance(progress, task_id, len(batch))
+                    batch = []
 
         if batch:
-            yield self._format_session_insert(batch)
+            yield fmt.batch(SESSION_TABLE, batch)
+            self._advance(progress, task_id, len(batch))
 
-    def _format_session_insert(self, values: list[str]) -> str:
-        """Format a batch INSERT for sessions."""
-        return f"""INSERT INTO session (session_id, website_id, browser, os, device, screen, language, country, region, city, created_at, distinct_id)
-VALUES
-{",".join(values)}
-ON CONFLICT (session_id) DO NOTHING;
-"""
+        finish = fmt.finish(SESSION_TABLE)
+        if finish:
+            yield finish
 
     def generate_events_sql(
         self,
@@ -600,13 +909,15 @@ ON CONFLICT (session_id) DO NOTHING;
 
         # Join with log_action to get URL, page title, and action type
         # Action types: 1=pageview, 2=outlink, 3=download
+        # Column order must match the row unpacking below
         query = f"""
             SELECT
                 lva.idlink_va,
                 lva.idvisit,
                 lva.idsite,
-                lva.server_time,
-                lva.idpageview,
+                {iso_datetime_sql("lva.server_time")} AS server_time,
+                lva.idaction_url,
+                lva.idaction_name,
                 url_action.name as url_name,
                 url_action.url_prefix,
                 url_action.type as action_type,
@@ -614,7 +925,7 @@ ON CONFLICT (session_id) DO NOTHING;
                 ref_action.name as ref_url,
                 ref_action.url_prefix as ref_url_prefix,
                 v.referer_url
-            FROM piwik_log_link_visit_action lva
+            FROM piwik_log_link_visit_action lva {self._event_index_hint(start_date, end_date)}
             LEFT JOIN piwik_log_action url_action ON lva.idaction_url = url_action.idaction
             LEFT JOIN piwik_log_action title_action ON lva.idaction_name = title_action.idaction
             LEFT JOIN piwik_log_action ref_action ON lva.idaction_url_ref = ref_action.idaction
@@ -632,137 +943,190 @@ ON CONFLICT (session_id) DO NOTHING;
         yield "-- Outlinks and downloads also generate event_data entries"
         yield ""
 
+        fmt = self.output
+        website_ids = self._website_id_literals()
+        event_types = {
+            action_type: (str(event_type), fmt.text(event_name))
+            for action_type, (event_type, event_name) in EVENT_TYPES.items()
+        }
+        data_key = fmt.text("url")
+        # Escaped columns per piwik_log_action ID: Matomo stores each distinct
+        # URL and title once, so many events share the same actions
+        url_cache: dict[int, tuple[str, str, str, str | None]] = {}
+        title_cache: dict[int | None, str] = {}
+
+        for table in (WEBSITE_EVENT_TABLE, EVENT_DATA_TABLE):
+            start = fmt.start(table)
+            if start:
+                yield start
+
         batch: list[str] = []
         event_data_batch: list[str] = []
-        for row in self.cursor:
-            mapping = self.get_site_mapping(row["idsite"])
-            if not mapping:
-                continue
-
-            event_id = generate_uuid_from_matomo_id(row["idlink_va"], "action")
-            session_id = generate_uuid_from_matomo_id(row["idvisit"], "visit")
-            # Use idvisit for visit_id to group all events from the same visit together
-            # This ensures correct bounce rate calculation (bounce = visit with only 1 event)
-            visit_id = generate_uuid_from_matomo_id(row["idvisit"], "visit")
-
-            # Parse URL
-            if row["url_name"]:
-                hostname, url_path, url_query = parse_matomo_url(
-                    row["url_name"], row["url_prefix"]
-                )
-            else:
-                hostname, url_path, url_query = mapping.domain, "/", None
-
-            # Parse referrer - prefer action referrer, fall back to visit referrer
-            if row["ref_url"]:
-                ref_domain, ref_path, ref_query = parse_matomo_url(
-                    row["ref_url"], row["ref_url_prefix"]
-                )
-            elif row["referer_url"]:
-                ref_domain, ref_path, ref_query = parse_referrer_url(row["referer_url"])
-            else:
-                ref_domain, ref_path, ref_query = None, None, None
-
-            # Map Matomo action type to Umami event_type and event_name
-            # Matomo: 1=pageview, 2=outlink, 3=download
-            # Umami: event_type 1=pageview, 2=custom event
-            action_type = row["action_type"]
-            if action_type == 1:
-                event_type = "1"
-                event_name = "NULL"
-            elif action_type == 2:
-                event_type = "2"
-                event_name = "'outlink'"
-            elif action_type == 3:
-                event_type = "2"
-                event_name = "'download'"
-            else:
-                event_type = "1"
-                event_name = "NULL"
-
-            values = (
-                f"'{event_id}'",
-                f"'{mapping.umami_website_id}'",
-                f"'{session_id}'",
-                format_timestamp(row["server_time"]),
-                escape_sql_string(url_path, 500),
-                escape_sql_string(url_query, 500),
-                escape_sql_string(ref_path, 500),
-                escape_sql_string(ref_query, 500),
-                escape_sql_string(ref_domain, 500),
-                escape_sql_string(row["page_title"], 500),
-                event_type,
-                event_name,
-                f"'{visit_id}'",
-                "NULL",  # tag
-                escape_sql_string(hostname, 100),
+        # Rows are fetched in blocks so their UUIDs are generated together
+        while rows := self.cursor.fetchmany(self.batch_size):
+            event_ids = generate_uuids_from_matomo_ids(
+                (row[0] for row in rows), "action"
             )
-            batch.append(f"({', '.join(values)})")
-
-            # For outlinks and downloads, also store the URL as event_data
-            if action_type in (2, 3):
-                # Build full URL for event_data using original Matomo URL
-                # (hostname, url_path, url_query already parsed from Matomo URL)
-                full_url = ""
-                if hostname:
-                    full_url = f"https://{hostname}"
-                full_url += url_path or ""
-                if url_query:
-                    full_url += f"?{url_query}"
-
-                event_data_id = generate_uuid_from_matomo_id(
-                    row["idlink_va"], "event_data"
-                )
-                event_data_values = (
-                    f"'{event_data_id}'",
-                    f"'{mapping.umami_website_id}'",
-                    f"'{event_id}'",
-                    "'url'",  # data_key
-                    escape_sql_string(full_url, 500),  # string_value
-                    "NULL",  # number_value
-                    "NULL",  # date_value
-                    "1",  # data_type = string
-                    format_timestamp(row["server_time"]),
+            for (
+                (
+                    idlink_va,
+                    idvisit,
+                    idsite,
+                    server_time,
+                    idaction_url,
+                    idaction_name,
+                    url_name,
+                    url_prefix,
+                    action_type,
+                    page_title,
+                    ref_url,
+                    ref_url_prefix,
+                    referer_url,
+                ),
+                event_id,
+            ) in zip(rows, event_ids):
+                mapping = self.get_site_mapping(idsite)
+                if not mapping:
+                    continue
+                website_id = website_ids[idsite]
+
+                if len(url_cache) >= self.ACTION_CACHE_SIZE:
+                    url_cache.clear()
+                if len(title_cache) >= self.ACTION_CACHE_SIZE:
+                    title_cache.clear()
+
+                session_id = generate_uuid_from_matomo_id(idvisit, "visit")
+                # Use idvisit for visit_id to group all events from the same visit together
+                # This ensures correct bounce rate calculation (bounce = visit with only 1 event)
+                visit_id = session_id
+
+                url_columns = url_cache.get(idaction_url)
+                if url_columns is None:
+                    url_columns = self._escaped_url_columns(
+                        url_name, url_prefix, action_type, mapping
+                    )
+                    # Nameless actions fall back to the site domain, so only
+                    # actions with a URL are shared across sites
+                    if url_name:
+                        url_cache[idaction_url] = url_columns
+                url_path_sql, url_query_sql, hostname_sql, full_url_sql = url_columns
+
+                page_title_sql = title_cache.get(idaction_name)
+                if page_title_sql is None:
+                    page_title_sql = fmt.text(page_title, 500)
+                    title_cache[idaction_name] = page_title_sql
+
+                # Parse referrer - prefer action referrer, fall back to visit referrer
+                if ref_url:
+                    ref_domain, ref_path, ref_query = parse_matomo_url(
+                        ref_url, ref_url_prefix
+                    )
+                elif referer_url:
+                    ref_domain, ref_path, ref_query = parse_referrer_url(referer_url)
+                else:
+                    ref_domain, ref_path, ref_query = None, None, None
+
+                event_type, event_name = event_types.get(action_type, event_types[1])
+
+                values = (
+                    fmt.text(event_id),
+                    website_id,
+                    fmt.text(session_id),
+                    fmt.timestamp(server_time),
+                    url_path_sql,
+                    url_query_sql,
+                    fmt.text(ref_path, 500),
+                    fmt.text(ref_query, 500),
+                    fmt.text(ref_domain, 500),
+                    page_title_sql,
+                    event_type,
+                    event_name,
+                    fmt.text(visit_id),
+                    fmt.null,  # tag
+                    hostname_sql,
                 )
-                event_data_batch.append(f"({', '.join(event_data_values)})")
-
-            if progress and task_id is not None:
-                progress.advance(task_id)
-
-            if len(batch) >= self.batch_size:
-                yield self._format_event_insert(batch)
-                batch = []
-
-            if len(event_data_batch) >= self.batch_size:
-                yield self._format_event_data_insert(event_data_batch)
-                event_data_batch = []
+                batch.append(fmt.row(values))
+
+                # For outlinks and downloads, also store the URL as event_data
+                if full_url_sql is not None:
+                    # Unique per event: caching it would only evict visit UUIDs
+                    event_data_id = generate_uncached_uuid_from_matomo_id(
+                        idlink_va, "event_data"
+                    )
+                    event_data_values = (
+                        fmt.text(event_data_id),
+                        website_id,
+                        fmt.text(event_id),
+                        data_key,
+                        full_url_sql,  # string_value
+                        fmt.null,  # number_value
+                        fmt.null,  # date_value
+                        "1",  # data_type = string
+                        fmt.timestamp(server_time),
+                    )
+                    event_data_batch.append(fmt.row(event_data_values))
+
+                if len(batch) >= self.batch_size:
+                    yield fmt.batch(WEBSITE_EVENT_TABLE, batch)
+                    self._advance(progress, task_id, len(batch))
+                    batch = []
+
+                if len(event_data_batch) >= self.batch_size:
+                    yield fmt.batch(EVENT_DATA_TABLE, event_data_batch)
+                    event_data_batch = []
 
         if batch:
-            yield self._format_event_insert(batch)
+            yield fmt.batch(WEBSITE_EVENT_TABLE, batch)
+            self._advance(progress, task_id, len(batch))
         if event_data_batch:
-            yield self._format_event_data_insert(event_data_batch)
+            yield fmt.batch(EVENT_DATA_TABLE, event_data_batch)
 
-    def _format_event_insert(self, values: list[str]) -> str:
-        """Format a batch INSERT for events."""
-        return f"""INSERT INTO website_event (event_id, website_id, session_id, created_at, url_path, url_query, referrer_path, referrer_query, referrer_domain, page_title, event_type, event_name, visit_id, tag, hostname)
-VALUES
-{",".join(values)}
-ON CONFLICT (event_id) DO NOTHING;
-"""
+        for table in (WEBSITE_EVENT_TABLE, EVENT_DATA_TABLE):
+            finish = fmt.finish(table)
+            if finish:
+                yield finish
 
-    def _format_event_data_insert(self, values: list[str]) -> str:
-        """Format a batch INSERT for event_data (outlink/download URLs)."""
-        return f"""INSERT INTO event_data (event_data_id, website_id, website_event_id, data_key, string_value, number_value, date_value, data_type, created_at)
-VALUES
-{",".join(values)}
-ON CONFLICT (event_data_id) DO NOTHING;
-"""
+    def _escaped_url_columns(
+        self,
+        url_name: str | None,
+        url_prefix: int | None,
+        action_type: int,
+        mapping: SiteMapping,
+    ) -> tuple[str, str, str, str | None]:
+        """Parse and escape an action URL for the website_event columns.
+
+        Returns escaped (url_path, url_query, hostname, event_data URL) values.
+        The event_data URL is only built for outlinks and downloads.
+        """
+        if url_name:
+            hostname, url_path, url_query = parse_matomo_url(url_name, url_prefix)
+        else:
+            hostname, url_path, url_query = mapping.domain, "/", None
+
+        full_url_sql = None
+        if action_type in (2, 3):
+            # Build full URL for event_data using original Matomo URL
+            full_url = ""
+            if hostname:
+                full_url = f"https://{hostname}"
+            full_url += url_path or ""
+            if url_query:
+                full_url += f"?{url_query}"
+            full_url_sql = self.output.text(full_url, 500)
+
+        return (
+            self.output.text(url_path, 500),
+            self.output.text(url_query, 500),
+            self.output.text(hostname, 100),
+            full_url_sql,
+        )
 
     def generate_migration_sql(
         self,
         start_date: datetime | None = None,
         end_date: datetime | None = None,
         output_file: str | None = None,
+        show_progress: bool = True,
     ) -> None:
         """Generate complete migration SQL.
 
@@ -773,6 +1137,7 @@ ON CONFLICT (event_data_id) DO NOTHING;
             start_date: Optional start date filter (inclusive)
             end_date: Optional end date filter (exclusive)
             output_file: Path to output file, or None for stdout
+            show_progress: Whether to render the progress bars
         """
         # Count totals for progress bar
         logger.info("Counting records to migrate...")
@@ -788,8 +1153,11 @@ ON CONFLICT (event_data_id) DO NOTHING;
             return
 
         # Open output file if specified (with explicit buffering for large files)
-        out: TextIO
-        if output_file:
+        out: TextIO | CompressedWriter
+        if output_file and self.compress:
+            out = CompressedWriter(open(output_file, "wb"))
+            logger.info(f"Writing zstd-compressed output to: {output_file}")
+        elif output_file:
             out = open(output_file, "w", buffering=1024 * 1024)  # 1MB buffer
             logger.info(f"Writing output to: {output_file}")
         else:
@@ -798,7 +1166,10 @@ ON CONFLICT (event_data_id) DO NOTHING;
         batches_written = 0
 
         def write(line: str) -> None:
-            out.write(line + "\n")
+            # Two writes instead of `line + "\n"`, which would copy every
+            # multi-megabyte batch statement once more before writing it
+            out.write(line)
+            out.write("\n")
 
         def flush_periodically() -> None:
             """Flush output periodically to ensure data is written."""
@@ -816,6 +1187,7 @@ ON CONFLICT (event_data_id) DO NOTHING;
                 MofNCompleteColumn(),
                 TimeElapsedColumn(),
                 console=console,
+                disable=not show_progress,
             ) as progress:
                 # Write header
                 write("-- Matomo to Umami Migration SQL")
@@ -841,7 +1213,10 @@ ON CONFLICT (event_data_id) DO NOTHING;
 
                 write("")
 
-                # Events
+                # Events are a second pass rather than fused into the session
+                # scan: they are filtered on lva.server_time while sessions use
+                # v.visit_first_action_time, so one joined scan would change
+                # which rows a date range selects at its edges.
                 logger.debug("Generating event SQL...")
                 event_task = progress.add_task("Events", total=event_count)
                 for line in self.generate_events_sql(
@@ -861,6 +1236,110 @@ ON CONFLICT (event_data_id) DO NOTHING;
             if output_file:
                 out.close()
 
+    def generate_migration_sql_parallel(
+        self,
+        output_file: str,
+        jobs: int,
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+    ) -> None:
+        """Generate migration SQL with one worker process per site.
+
+        Sites are independent, so each worker streams a single site over its
+        own MySQL connection into a shard file. Shards are concatenated into
+        output_file in site mapping order; each one is its own transaction.
+        Compressed shards are separate zstd frames, which concatenate into a
+        valid zstd file. A site mapped more than once is migrated once, with
+        its last mapping, like the sequential path.
+
+        Args:
+            output_file: Path to output file
+            jobs: Maximum number of worker processes
+            start_date: Optional start date filter (inclusive)
+            end_date: Optional end date filter (exclusive)
+        """
+        shards = {idsite: f"{output_file}.{idsite}.part" for idsite in self._site_map}
+
+        try:
+            # Sites without data in the range produce no shard, so a shard
+            # left over by a killed run would be merged as if it were current
+            for shard in shards.values():
+                Path(shard).unlink(missing_ok=True)
+
+            with (
+                ProcessPoolExecutor(max_workers=jobs) as executor,
+                Progress(
+                    SpinnerColumn(),
+                    TextColumn("[progress.description]{task.description}"),
+                    BarColumn(),
+                    MofNCompleteColumn(),
+                    TimeElapsedColumn(),
+                    console=console,
+                ) as progress,
+            ):
+                site_task = progress.add_task("Sites", total=len(shards))
+                futures = [
+                    executor.submit(
+                        _migrate_site_shard,
+                        mysql_config=self.mysql_config,
+                        site_mapping=mapping,
+                        batch_size=self.batch_size,
+                        start_date=start_date,
+                        end_date=end_date,
+                        output_file=shards[mapping.matomo_idsite],
+                        output_format=self.output_format,
+                        compress=self.compress,
+                    )
+                    for mapping in self._site_map.values()
+                ]
+                for future in as_completed(futures):
+                    future.result()
+                    progress.advance(site_task)
+
+            with open(output_file, "wb") as out:
+                for shard in shards.values():
+                    if Path(shard).exists():
+                        with open(shard, "rb") as shard_file:
+                            shutil.copyfileobj(shard_file, out, 1024 * 1024)
+            logger.info(f"Migration SQL written to {output_file}")
+        finally:
+            for shard in shards.values():
+                Path(shard).unlink(missing_ok=True)
+
+
+def _migrate_site_shard(
+    mysql_config: dict[str, Any],
+    site_mapping: SiteMapping,
+    batch_size: int,
+    start_date: datetime | None,
+    end_date: datetime | None,
+    output_file: str,
+    output_format: str,
+    compress: bool,
+) -> None:
+    """Generate the migration SQL for a single site into a shard file.
+
+    Runs in a worker process, so it opens its own MySQL connection.
+    """
+    migrator = MatomoToUmamiMigrator(
+        mysql_host=mysql_config["host"],
+        mysql_port=mysql_config["port"],
+        mysql_user=mysql_config["user"],
+        mysql_password=mysql_config["password"],
+        mysql_database=mysql_config["database"],
+        site_mappings=[site_mapping],
+        batch_size=batch_size,
+        output_format=output_format,
+        compress=compress,
+    )
+    try:
+        migrator.connect()
+        migrator.generate_migration_sql(
+            start_date, end_date, output_file, show_progress=False
+        )
+    finally:
+        migrator.close()
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Migrate Matomo data to Umami SQL")
@@ -875,6 +1354,24 @@ def main() -> None:
     parser.add_argument(
         "--batch-size", type=int, default=1000, help="Batch size for INSERTs"
     )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Worker processes, one site per worker (requires --output)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(OUTPUT_FORMATS),
+        default="sql",
+        help="Output format: INSERT statements, or COPY blocks for psql",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Write zstd-compressed output (requires --output)",
+    )
 
     # Site mappings (required)
     parser.add_argument(
@@ -906,6 +1403,19 @@ def main() -> None:
     # Setup logging based on verbosity
     setup_logging(args.verbose)
 
+    if args.jobs < 1:
+        console.print("[red]Error:[/red] --jobs must be at least 1", highlight=False)
+        sys.exit(1)
+    if args.jobs > 1 and not args.output and not args.dry_run:
+        console.print(
+            "[red]Error:[/red] --jobs requires --output (shards are merged into it)",
+            highlight=False,
+        )
+        sys.exit(1)
+    if args.compress and not args.output and not args.dry_run:
+        console.print("[red]Error:[/red] --compress requires --output", highlight=False)
+        sys.exit(1)
+
     # Parse and validate site mappings
     site_mappings = []
     for mapping_str in args.site_mapping:
@@ -942,6 +1452,8 @@ def main() -> None:
         mysql_database=args.mysql_database,
         site_mappings=site_mappings,
         batch_size=args.batch_size,
+        output_format=args.format,
+        compress=args.compress,
     )
 
     try:
@@ -962,6 +1474,14 @@ def main() -> None:
                 console.print(
                     "\n[green]Ready to migrate.[/green] Run without --dry-run to generate SQL."
                 )
+        elif args.jobs > 1 and len(site_mappings) > 1:
+            # Full migration, one worker process per site
+            migrator.generate_migration_sql_parallel(
+                output_file=args.output,
+                jobs=args.jobs,
+                start_date=start_date,
+                end_date=end_date,
+            )
         else:
             # Full migration
             migrator.generate_migration_sql(
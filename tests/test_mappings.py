@@ -1,9 +1,18 @@
 """Tests for field mappings."""
 
+from urllib.parse import urlparse
+
 import pytest
 
 from matomo_to_umami.mappings import (
+    BROWSER_MAPPING,
+    DEVICE_TYPES,
+    OS_MAPPING,
+    UUID_NAMESPACE,
+    _split_url,
+    generate_uncached_uuid_from_matomo_id,
     generate_uuid_from_matomo_id,
+    generate_uuids_from_matomo_ids,
     map_browser,
     map_device_type,
     map_os,
@@ -12,10 +21,18 @@ from matomo_to_umami.mappings import (
     truncate_field,
 )
 from matomo_to_umami.migrate import (
+    SESSION_TABLE,
+    CopyFormat,
     SiteMappingError,
+    SqlInsertFormat,
+    escape_csv_field,
+    iso_datetime_sql,
     validate_site_mapping,
 )
-from matomo_to_umami.region_mappings import convert_region_to_iso
+from matomo_to_umami.region_mappings import (
+    REGION_FIPS_TO_ISO,
+    convert_region_to_iso,
+)
 
 
 class TestParseMatmoUrl:
@@ -35,6 +52,13 @@ class TestParseMatmoUrl:
         assert path == "/"
         assert query is None
 
+    def test_prefix_1_http(self):
+        """URL prefix 1 = http://"""
+        hostname, path, query = parse_matomo_url("example.com/page?a=1", 1)
+        assert hostname == "example.com"
+        assert path == "/page"
+        assert query == "a=1"
+
     def test_prefix_2_https(self):
         """URL prefix 2 = https://"""
         hostname, path, query = parse_matomo_url("stanislas.blog/path/to/page", 2)
@@ -49,6 +73,16 @@ class TestParseMatmoUrl:
         assert path == "/page"
         assert query is None
 
+    def test_prefix_3_matches_joined_url(self):
+        """Prefix 3 splits like the joined https://www.{name} URL."""
+        for name in ("example.com:8080/a;b?c=1#d", "?q=1", "[::1]/x"):
+            parsed = urlparse("https://www." + name)
+            assert parse_matomo_url(name, 3) == (
+                parsed.netloc,
+                parsed.path or "/",
+                parsed.query or None,
+            )
+
     def test_prefix_none_defaults_to_0(self):
         """None prefix treated as 0."""
         hostname, path, query = parse_matomo_url("example.com/test", None)
@@ -64,6 +98,39 @@ class TestParseMatmoUrl:
         assert query is None
 
 
+class TestSplitUrl:
+    """_split_url must agree with urlparse, which it replaces."""
+
+    @pytest.mark.parametrize(
+        "url",
+        [
+            "https://example.com",
+            "https://example.com/",
+            "http://example.com:8080/port",
+            "https://example.com/page?a=1&b='x'",
+            "https://example.com/page?",
+            "https://example.com#frag?notquery",
+            "https://example.com/a?b?c#d?e",
+            "https://example.com/p;jsessionid=1/q;x=2?z=3#f",
+            "https://example.com/p;x/q",
+            "https://user:pw@example.com/x",
+            "https:////cdn.example/x",
+            "HTTPS://Example.com/Path",
+            "https://ünïcode.example/pâth?q=é",
+            "https://[::1]:8080/x",
+            "https://example.com/a\tb\nc",
+            "android-app://com.google",
+        ],
+    )
+    def test_matches_urlparse(self, url):
+        parsed = urlparse(url)
+        assert _split_url(url) == (parsed.netloc, parsed.path, parsed.query)
+
+    def test_invalid_ipv6_still_raises(self):
+        with pytest.raises(ValueError):
+            _split_url("https://[::1/x")
+
+
 class TestParseReferrerUrl:
     """Tests for parse_referrer_url function."""
 
@@ -81,6 +148,24 @@ class TestParseReferrerUrl:
         assert path == "/"
         assert query is None
 
+    def test_url_without_protocol_with_query_and_fragment(self):
+        hostname, path, query = parse_referrer_url("www.ex.com/a;b?c=1#d?e")
+        assert hostname == "ex.com"
+        assert path == "/a"
+        assert query == "c=1"
+
+    def test_other_scheme(self):
+        hostname, path, query = parse_referrer_url("android-app://com.google/x?y")
+        assert hostname == "com.google"
+        assert path == "/x"
+        assert query == "y"
+
+    def test_only_www_prefix_is_stripped(self):
+        """Other subdomains are kept, as Umami only strips www."""
+        assert parse_referrer_url("https://m.facebook.com/")[0] == "m.facebook.com"
+        assert parse_referrer_url("https://www2.example.com/")[0] == "www2.example.com"
+        assert parse_referrer_url("https://wwwexample.com/")[0] == "wwwexample.com"
+
     def test_none_input(self):
         hostname, path, query = parse_referrer_url(None)
         assert hostname is None
@@ -97,67 +182,75 @@ class TestParseReferrerUrl:
 class TestMapBrowser:
     """Tests for browser code mapping."""
 
-    def test_chrome(self):
+    @pytest.mark.parametrize(
+        ("code", "expected"),
+        [
+            ("CH", "chrome"),
+            ("FF", "firefox"),
+            ("SF", "safari"),
+            ("CM", "chrome"),  # Maps to base browser
+            ("XX", "unknown"),
+            (None, None),
+            ("", None),
+        ],
+    )
+    def test_map_browser(self, code, expected):
+        assert map_browser(code) == expected
+
+    def test_table_is_read_only(self):
+        with pytest.raises(TypeError):
+            BROWSER_MAPPING["CH"] = "firefox"  # type: ignore[index]
         assert map_browser("CH") == "chrome"
 
-    def test_firefox(self):
-        assert map_browser("FF") == "firefox"
-
-    def test_safari(self):
-        assert map_browser("SF") == "safari"
-
-    def test_chrome_mobile(self):
-        assert map_browser("CM") == "chrome"  # Maps to base browser
-
-    def test_unknown_browser_returns_unknown(self):
-        assert map_browser("XX") == "unknown"
-
-    def test_none(self):
-        assert map_browser(None) is None
-
 
 class TestMapOs:
     """Tests for OS code mapping."""
 
-    def test_windows(self):
-        assert map_os("WIN") == "Windows 10"
-
-    def test_macos(self):
-        assert map_os("MAC") == "Mac OS"
-
-    def test_linux(self):
-        assert map_os("LIN") == "Linux"
-
-    def test_android(self):
-        assert map_os("AND") == "Android OS"
-
-    def test_ios(self):
-        assert map_os("IOS") == "iOS"
-
-    def test_unknown_os_defaults_to_linux(self):
-        assert map_os("XXX") == "Linux"
-
-    def test_none(self):
-        assert map_os(None) is None
+    @pytest.mark.parametrize(
+        ("code", "expected"),
+        [
+            ("WIN", "Windows 10"),
+            ("MAC", "Mac OS"),
+            ("LIN", "Linux"),
+            ("AND", "Android OS"),
+            ("IOS", "iOS"),
+            ("XXX", "Linux"),  # Unknown OS defaults to Linux
+            (None, None),
+            ("", None),
+        ],
+    )
+    def test_map_os(self, code, expected):
+        assert map_os(code) == expected
 
 
 class TestMapDeviceType:
     """Tests for device type mapping."""
 
-    def test_desktop(self):
-        assert map_device_type(0) == "desktop"
+    @pytest.mark.parametrize(
+        ("device_type", "expected"),
+        [
+            (0, "desktop"),
+            (1, "mobile"),  # smartphone maps to mobile
+            (2, "tablet"),
+            (99, "desktop"),  # Unknown defaults to desktop
+            (None, None),
+        ],
+    )
+    def test_map_device_type(self, device_type, expected):
+        assert map_device_type(device_type) == expected
+
 
-    def test_smartphone(self):
-        assert map_device_type(1) == "mobile"  # smartphone maps to mobile
+class TestMappedNamesFitUmamiColumns:
+    """Mapped names are not truncated, so they must fit Umami's varchar(20)."""
 
-    def test_tablet(self):
-        assert map_device_type(2) == "tablet"
+    def test_browser_names(self):
+        assert max(len(name) for name in BROWSER_MAPPING.values()) <= 20
 
-    def test_unknown_defaults_to_desktop(self):
-        assert map_device_type(99) == "desktop"
+    def test_os_names(self):
+        assert max(len(name) for name in OS_MAPPING.values()) <= 20
 
-    def test_none(self):
-        assert map_device_type(None) is None
+    def test_device_names(self):
+        assert max(len(name) for name in DEVICE_TYPES.values()) <= 20
 
 
 class TestGenerateUuid:
@@ -189,6 +282,28 @@ class TestGenerateUuid:
         # Should not raise
         uuid.UUID(uuid_str)
 
+    def test_matches_uuid5(self):
+        """Output matches plain uuid5 so re-runs keep producing the same IDs."""
+        import uuid
+
+        for matomo_id, prefix in [(1, "visit"), (1412530, "visit"), (7, "action")]:
+            expected = uuid.uuid5(UUID_NAMESPACE, f"matomo:{prefix}:{matomo_id}")
+            assert generate_uuid_from_matomo_id(matomo_id, prefix) == str(expected)
+
+    def test_batch_matches_single(self):
+        """Batch generation gives the same UUIDs as one at a time."""
+        ids = list(range(1, 2000)) + [1412530, 2**40]
+        assert generate_uuids_from_matomo_ids(ids, "action") == [
+            generate_uuid_from_matomo_id(matomo_id, "action") for matomo_id in ids
+        ]
+
+    def test_uncached_matches_cached(self):
+        generate_uuid_from_matomo_id.cache_clear()
+        assert generate_uncached_uuid_from_matomo_id(
+            1412530, "event_data"
+        ) == generate_uuid_from_matomo_id(1412530, "event_data")
+        assert generate_uuid_from_matomo_id.cache_info().currsize == 1
+
 
 class TestTruncateField:
     """Tests for field truncation."""
@@ -206,6 +321,74 @@ class TestTruncateField:
         assert truncate_field(None, 10) is None
 
 
+class TestIsoDatetimeSql:
+    """Tests for the SQL timestamp formatting expression."""
+
+    def test_zero_dates_are_null(self):
+        sql = iso_datetime_sql("lva.server_time")
+        assert sql.startswith(
+            "IF(YEAR(lva.server_time) = 0 OR MONTH(lva.server_time) = 0 "
+            "OR DAY(lva.server_time) = 0, NULL, DATE_FORMAT(lva.server_time,"
+        )
+
+    def test_no_query_placeholders(self):
+        """A lowercase %s would be substituted by mysql.connector."""
+        assert "%s" not in iso_datetime_sql("v.visit_first_action_time")
+
+
+class TestEscapeCsvField:
+    """Tests for COPY output field escaping."""
+
+    def test_none_is_unquoted_empty(self):
+        assert escape_csv_field(None) == ""
+
+    def test_empty_string_is_quoted(self):
+        """Empty strings must not be read back as NULL."""
+        assert escape_csv_field("") == '""'
+
+    def test_quotes_doubled(self):
+        assert escape_csv_field('say "hi", O\'Fallon') == '"say ""hi"", O\'Fallon"'
+
+    def test_truncates(self):
+        assert escape_csv_field("abcdef", 3) == '"abc"'
+
+    def test_end_of_data_marker_quoted(self):
+        """A value of \\. cannot end the COPY data early."""
+        assert CopyFormat.row((escape_csv_field("\\."),)) == '"\\."'
+
+    @pytest.mark.parametrize(
+        "value",
+        ["title\n\\.\nDROP TABLE session;", "a\r\n\\.\r\nb", "a\n\\.\n\\.\nb"],
+    )
+    def test_end_of_data_line_in_multiline_value_removed(self, value):
+        """psql ends COPY data at a \\. line even inside a quoted field."""
+        field = escape_csv_field(value)
+        lines = [line.removesuffix("\r") for line in field.split("\n")]
+        assert "\\." not in lines
+        assert len(lines) == len(value.split("\n"))
+
+    def test_other_backslash_dot_lines_kept(self):
+        assert escape_csv_field("a\n\\.b\n\\. c") == '"a\n\\.b\n\\. c"'
+
+
+class TestOutputFormats:
+    """Tests for the INSERT and COPY output formats."""
+
+    def test_batch_targets_staging_table(self):
+        fmt = CopyFormat()
+        block = fmt.batch(SESSION_TABLE, ['"a"', '"b"'])
+        assert block.startswith("COPY session_import (session_id,")
+        assert block.endswith('"a"\n"b"\n\\.\n')
+        assert "ON CONFLICT (session_id) DO NOTHING" in fmt.finish(SESSION_TABLE)
+
+    def test_sql_batch_is_one_multi_row_insert(self):
+        fmt = SqlInsertFormat()
+        rows = [fmt.row(("'a'", "1")), fmt.row(("'b'", "NULL"))]
+        block = fmt.batch(SESSION_TABLE, rows)
+        assert block.count("INSERT INTO session ") == 1
+        assert "VALUES\n('a', 1),('b', NULL)\nON CONFLICT" in block
+
+
 class TestValidateSiteMapping:
     """Tests for site mapping validation."""
 
@@ -218,6 +401,14 @@ class TestValidateSiteMapping:
         assert mapping.umami_website_id == "550e8400-e29b-41d4-a716-446655440000"
         assert mapping.domain == "example.com"
 
+    def test_valid_mapping_is_cached(self):
+        """Repeated mapping strings return the same immutable SiteMapping."""
+        mapping_str = "3:550e8400-e29b-41d4-a716-446655440000:example.com"
+        mapping = validate_site_mapping(mapping_str)
+        assert validate_site_mapping(mapping_str) is mapping
+        with pytest.raises(AttributeError):
+            mapping.domain = "other.com"
+
     def test_valid_mapping_with_subdomain(self):
         """Domain can include subdomains."""
         mapping = validate_site_mapping(
@@ -231,6 +422,14 @@ class TestValidateSiteMapping:
             validate_site_mapping("1:example.com")
         assert "Invalid site mapping format" in str(excinfo.value)
 
+    def test_invalid_format_too_many_parts(self):
+        """Extra colons (e.g. a port in the domain) are rejected up front."""
+        with pytest.raises(SiteMappingError) as excinfo:
+            validate_site_mapping(
+                "1:550e8400-e29b-41d4-a716-446655440000:example.com:8080"
+            )
+        assert "Invalid site mapping format" in str(excinfo.value)
+
     def test_invalid_matomo_id_not_integer(self):
         """Non-integer Matomo ID raises error."""
         with pytest.raises(SiteMappingError) as excinfo:
@@ -257,6 +456,14 @@ class TestValidateSiteMapping:
             validate_site_mapping("1:not-a-valid-uuid:example.com")
         assert "Invalid Umami UUID" in str(excinfo.value)
 
+    def test_invalid_uuid_trailing_newline(self):
+        """A trailing newline is not accepted as part of the UUID."""
+        with pytest.raises(SiteMappingError) as excinfo:
+            validate_site_mapping(
+                "1:550e8400-e29b-41d4-a716-446655440000\n:example.com"
+            )
+        assert "Invalid Umami UUID" in str(excinfo.value)
+
     def test_invalid_domain_empty(self):
         """Empty domain raises error."""
         with pytest.raises(SiteMappingError) as excinfo:
@@ -273,73 +480,58 @@ class TestValidateSiteMapping:
 class TestExpandedBrowserMappings:
     """Tests for browser mappings to Umami-recognized browsers."""
 
-    def test_brave(self):
-        assert map_browser("BR") == "brave"
-
-    def test_samsung(self):
-        assert map_browser("SB") == "samsung"
-
-    def test_opera_mini(self):
-        assert map_browser("OI") == "opera-mini"
-
-    def test_facebook(self):
-        assert map_browser("FB") == "facebook"
-
-    def test_instagram(self):
-        assert map_browser("IG") == "instagram"
-
-    def test_yandex(self):
-        assert map_browser("YA") == "yandexbrowser"
-
-    def test_chromium(self):
-        assert map_browser("CR") == "chrome"
-
-    def test_chromium_based_browsers(self):
-        """Chromium-based browsers map to chrome."""
-        assert map_browser("VI") == "chrome"  # Vivaldi
-        assert map_browser("AR") == "chrome"  # Arc
-        assert map_browser("DU") == "chrome"  # DuckDuckGo
-
-    def test_unrecognized_browsers_return_unknown(self):
-        """Browsers not in our mapping return 'unknown'."""
-        assert map_browser("XX") == "unknown"  # Unknown code
-
-    def test_firefox_based_browsers(self):
-        """Firefox-based browsers map to firefox."""
-        assert map_browser("PS") == "firefox"  # Pale Moon
-        assert map_browser("F1") == "firefox"  # Firefox Focus
-        assert map_browser("TH") == "firefox"  # Tor Browser
+    @pytest.mark.parametrize(
+        ("code", "expected"),
+        [
+            ("BR", "brave"),
+            ("SB", "samsung"),
+            ("OI", "opera-mini"),
+            ("FB", "facebook"),
+            ("IG", "instagram"),
+            ("YA", "yandexbrowser"),
+            # Chromium-based browsers map to chrome
+            ("CR", "chrome"),  # Chromium
+            ("VI", "chrome"),  # Vivaldi
+            ("AR", "chrome"),  # Arc
+            ("DU", "chrome"),  # DuckDuckGo
+            # Firefox-based browsers map to firefox
+            ("PS", "firefox"),  # Pale Moon
+            ("F1", "firefox"),  # Firefox Focus
+            ("TH", "firefox"),  # Tor Browser
+            # Browsers not in our mapping return 'unknown'
+            ("XX", "unknown"),
+        ],
+    )
+    def test_map_browser(self, code, expected):
+        assert map_browser(code) == expected
 
 
 class TestExpandedOSMappings:
     """Tests for OS mappings to Umami detect-browser format."""
 
-    def test_linux_distros_map_to_linux(self):
-        """Linux distributions all map to Linux."""
-        assert map_os("UBT") == "Linux"  # Ubuntu
-        assert map_os("FED") == "Linux"  # Fedora
-        assert map_os("ARC") == "Linux"  # Arch
-        assert map_os("POP") == "Linux"  # Pop!_OS
-
-    def test_bsd_variants(self):
-        """BSD variants map appropriately."""
-        assert map_os("FRE") == "Linux"  # FreeBSD
-        assert map_os("OPE") == "Open BSD"  # OpenBSD
-
-    def test_harmonyos(self):
-        """HarmonyOS maps to Android OS (closest match)."""
-        assert map_os("HAR") == "Android OS"
-
-    def test_windows_variants(self):
-        """Windows versions map to specific versions."""
-        assert map_os("WI7") == "Windows 7"
-        assert map_os("W81") == "Windows 8.1"
-        assert map_os("W10") == "Windows 10"
-
-    def test_ios_variants(self):
-        """iOS device types all map to iOS."""
-        assert map_os("IPA") == "iOS"  # iPad
-        assert map_os("IPH") == "iOS"  # iPhone
+    @pytest.mark.parametrize(
+        ("code", "expected"),
+        [
+            # Linux distributions all map to Linux
+            ("UBT", "Linux"),  # Ubuntu
+            ("FED", "Linux"),  # Fedora
+            ("ARC", "Linux"),  # Arch
+            ("POP", "Linux"),  # Pop!_OS
+            # BSD variants map appropriately
+            ("FRE", "Linux"),  # FreeBSD
+            ("OPE", "Open BSD"),  # OpenBSD
+            ("HAR", "Android OS"),  # HarmonyOS, closest match
+            # Windows versions map to specific versions
+            ("WI7", "Windows 7"),
+            ("W81", "Windows 8.1"),
+            ("W10", "Windows 10"),
+            # iOS device types all map to iOS
+            ("IPA", "iOS"),  # iPad
+            ("IPH", "iOS"),  # iPhone
+        ],
+    )
+    def test_map_os(self, code, expected):
+        assert map_os(code) == expected
 
 
 class TestRegionMapping:
@@ -394,3 +586,14 @@ class TestRegionMapping:
     def test_belgium_brussels(self):
         """Belgian FIPS 03 converts to ISO BRU (Brussels)."""
         assert convert_region_to_iso("BE", "03") == "BRU"
+
+    def test_every_table_entry_converts(self):
+        """The flattened lookup covers every entry of REGION_FIPS_TO_ISO."""
+        for country, regions in REGION_FIPS_TO_ISO.items():
+            for fips_region, iso_region in regions.items():
+                assert convert_region_to_iso(country, fips_region) == iso_region
+
+    def test_region_of_another_country_returns_original(self):
+        """A region code only converts for the country it belongs to."""
+        assert "A8" in REGION_FIPS_TO_ISO["FR"]
+        assert convert_region_to_iso("DE", "A8") == "A8"
@@ -4,19 +4,38 @@ These tests compare migrated data against existing Umami data
 in the overlap period to validate the mappings are correct.
 """
 
+import errno
+import io
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
 
 import mysql.connector
 import psycopg2
 import pytest
 
-# Skip if databases not available
 MYSQL_HOST = os.environ.get("MYSQL_HOST", "localhost")
 MYSQL_PORT = int(os.environ.get("MYSQL_PORT", "3307"))
 POSTGRES_HOST = os.environ.get("POSTGRES_HOST", "localhost")
 POSTGRES_PORT = int(os.environ.get("POSTGRES_PORT", "5433"))
 
+MYSQL_CONFIG = {
+    "host": MYSQL_HOST,
+    "port": MYSQL_PORT,
+    "user": "root",
+    "password": "password",
+    "database": "matomo",
+}
+POSTGRES_CONFIG = {
+    "host": POSTGRES_HOST,
+    "port": POSTGRES_PORT,
+    "user": "app",
+    "password": "password",
+    "database": "app",
+}
+
 # Site mappings for test data
 SITE_MAPPINGS = {
     # Matomo idsite -> (umami_website_id, domain)
@@ -26,309 +45,314 @@ SITE_MAPPINGS = {
 }
 
 
-def get_mysql_connection():
-    """Get MySQL connection for Matomo."""
+def _mysql_available() -> bool:
+    """Check once, with a short timeout, whether the Matomo MySQL is up."""
     try:
-        return mysql.connector.connect(
-            host=MYSQL_HOST,
-            port=MYSQL_PORT,
-            user="root",
-            password="password",
-            database="matomo",
-        )
+        mysql.connector.connect(**MYSQL_CONFIG, connection_timeout=1).close()
     except mysql.connector.Error:
-        pytest.skip("MySQL not available")
+        return False
+    return True
 
 
-def get_postgres_connection():
-    """Get PostgreSQL connection for Umami."""
+def _postgres_available() -> bool:
+    """Check once, with a short timeout, whether the Umami PostgreSQL is up."""
     try:
-        return psycopg2.connect(
-            host=POSTGRES_HOST,
-            port=POSTGRES_PORT,
-            user="app",
-            password="password",
-            database="app",
-        )
+        psycopg2.connect(**POSTGRES_CONFIG, connect_timeout=1).close()
     except psycopg2.Error:
-        pytest.skip("PostgreSQL not available")
+        return False
+    return True
 
 
+# Skip if databases not available
+MYSQL_AVAILABLE = _mysql_available()
+POSTGRES_AVAILABLE = _postgres_available()
+requires_mysql = pytest.mark.skipif(not MYSQL_AVAILABLE, reason="MySQL not available")
+requires_databases = pytest.mark.skipif(
+    not (MYSQL_AVAILABLE and POSTGRES_AVAILABLE),
+    reason="MySQL or PostgreSQL not available",
+)
+
+
+@pytest.fixture(scope="session")
+def mysql_conn():
+    """MySQL connection for Matomo, shared by all tests."""
+    conn = mysql.connector.connect(**MYSQL_CONFIG)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope="session")
+def pg_conn():
+    """PostgreSQL connection for Umami, shared by all tests."""
+    conn = psycopg2.connect(**POSTGRES_CONFIG)
+    # Without autocommit, one failing query would leave the shared connection
+    # in an aborted transaction and fail every later test with it
+    conn.set_session(readonly=True, autocommit=True)
+    yield conn
+    conn.close()
+
+
+@requires_databases
 class TestDataOverlap:
     """Tests that validate data in the overlap period."""
 
-    def test_overlap_period_exists(self):
+    def test_overlap_period_exists(self, mysql_conn, pg_conn):
         """Verify we have overlapping data to test with."""
-        mysql_conn = get_mysql_connection()
-        pg_conn = get_postgres_connection()
-
-        try:
-            # Get Matomo date range
-            mysql_cur = mysql_conn.cursor()
-            mysql_cur.execute("""
-                SELECT MIN(visit_first_action_time), MAX(visit_first_action_time)
-                FROM piwik_log_visit
-            """)
-            matomo_min, matomo_max = mysql_cur.fetchone()
-
-            # Get Umami date range
-            pg_cur = pg_conn.cursor()
-            pg_cur.execute("""
-                SELECT MIN(created_at), MAX(created_at)
-                FROM session
-            """)
-            umami_min, umami_max = pg_cur.fetchone()
-
-            # Verify overlap
-            assert matomo_min is not None, "No Matomo data"
-            assert umami_min is not None, "No Umami data"
-
-            # Overlap should be from Umami start to either end
-            overlap_start = max(matomo_min, umami_min.replace(tzinfo=None))
-            overlap_end = min(matomo_max, umami_max.replace(tzinfo=None))
-
-            assert overlap_start < overlap_end, "No overlap period"
-
-            print(f"\nOverlap period: {overlap_start} to {overlap_end}")
-
-        finally:
-            mysql_conn.close()
-            pg_conn.close()
-
-    def test_daily_visit_counts_similar(self):
+        # Get Matomo date range
+        mysql_cur = mysql_conn.cursor()
+        mysql_cur.execute("""
+            SELECT MIN(visit_first_action_time), MAX(visit_first_action_time)
+            FROM piwik_log_visit
+        """)
+        matomo_min, matomo_max = mysql_cur.fetchone()
+
+        # Get Umami date range
+        pg_cur = pg_conn.cursor()
+        pg_cur.execute("""
+            SELECT MIN(created_at), MAX(created_at)
+            FROM session
+        """)
+        umami_min, umami_max = pg_cur.fetchone()
+
+        # Verify overlap
+        assert matomo_min is not None, "No Matomo data"
+        assert umami_min is not None, "No Umami data"
+
+        # Overlap should be from Umami start to either end
+        overlap_start = max(matomo_min, umami_min.replace(tzinfo=None))
+        overlap_end = min(matomo_max, umami_max.replace(tzinfo=None))
+
+        assert overlap_start < overlap_end, "No overlap period"
+
+        print(f"\nOverlap period: {overlap_start} to {overlap_end}")
+
+    def test_daily_visit_counts_similar(self, mysql_conn, pg_conn):
         """Compare daily visit counts between Matomo and Umami.
 
         They won't be exact due to different tracking, but should be
         in the same order of magnitude.
         """
-        mysql_conn = get_mysql_connection()
-        pg_conn = get_postgres_connection()
-
-        try:
-            # Test a specific week in the overlap period
-            test_date = datetime(2023, 6, 1)
-
-            # Get Matomo counts for stanislas.blog (idsite 5)
-            mysql_cur = mysql_conn.cursor()
-            mysql_cur.execute(
-                """
-                SELECT DATE(visit_first_action_time) as date, COUNT(*) as visits
-                FROM piwik_log_visit
-                WHERE idsite = 5
-                  AND visit_first_action_time >= %s
-                  AND visit_first_action_time < %s
-                GROUP BY DATE(visit_first_action_time)
-                ORDER BY date
-            """,
-                (test_date, test_date + timedelta(days=7)),
-            )
-            matomo_counts = {row[0]: row[1] for row in mysql_cur.fetchall()}
-
-            # Get Umami counts for stanislas.blog
-            pg_cur = pg_conn.cursor()
-            pg_cur.execute(
-                """
-                SELECT DATE(created_at) as date, COUNT(*) as sessions
-                FROM session
-                WHERE website_id = '3824c584-bc9d-4a9b-aa35-9aa64f797c6f'
-                  AND created_at >= %s
-                  AND created_at < %s
-                GROUP BY DATE(created_at)
-                ORDER BY date
-            """,
-                (test_date, test_date + timedelta(days=7)),
-            )
-            umami_counts = {row[0]: row[1] for row in pg_cur.fetchall()}
+        # Test a specific week in the overlap period
+        test_date = datetime(2023, 6, 1)
+
+        # Get Matomo counts for stanislas.blog (idsite 5)
+        mysql_cur = mysql_conn.cursor()
+        mysql_cur.execute(
+            """
+            SELECT DATE(visit_first_action_time) as date, COUNT(*) as visits
+            FROM piwik_log_visit
+            WHERE idsite = 5
+              AND visit_first_action_time >= %s
+              AND visit_first_action_time < %s
+            GROUP BY DATE(visit_first_action_time)
+            ORDER BY date
+        """,
+            (test_date, test_date + timedelta(days=7)),
+        )
+        matomo_counts = {row[0]: row[1] for row in mysql_cur.fetchall()}
+
+        # Get Umami counts for stanislas.blog
+        pg_cur = pg_conn.cursor()
+        pg_cur.execute(
+            """
+            SELECT DATE(created_at) as date, COUNT(*) as sessions
+            FROM session
+            WHERE website_id = '3824c584-bc9d-4a9b-aa35-9aa64f797c6f'
+              AND created_at >= %s
+              AND created_at < %s
+            GROUP BY DATE(created_at)
+            ORDER BY date
+        """,
+            (test_date, test_date + timedelta(days=7)),
+        )
+        umami_counts = {row[0]: row[1] for row in pg_cur.fetchall()}
 
-            # Verify counts are similar (within 50% - accounting for different tracking)
-            for date in matomo_counts:
-                if date in umami_counts:
-                    matomo_val = matomo_counts[date]
-                    umami_val = umami_counts[date]
-                    ratio = min(matomo_val, umami_val) / max(matomo_val, umami_val)
+        # Verify counts are similar (within 50% - accounting for different tracking)
+        too_different = []
+        for date in sorted(matomo_counts.keys() & umami_counts.keys()):
+            matomo_val = matomo_counts[date]
+            umami_val = umami_counts[date]
+            ratio = min(matomo_val, umami_val) / max(matomo_val, umami_val)
 
-                    print(
-                        f"{date}: Matomo={matomo_val}, Umami={umami_val}, ratio={ratio:.2f}"
-                    )
+            print(f"{date}: Matomo={matomo_val}, Umami={umami_val}, ratio={ratio:.2f}")
 
-                    # They should be within 50% of each other
-                    assert ratio > 0.5, (
-                        f"Counts too different on {date}: {matomo_val} vs {umami_val}"
-                    )
+            # They should be within 50% of each other
+            if ratio <= 0.5:
+                too_different.append(f"{date}: {matomo_val} vs {umami_val}")
 
-        finally:
-            mysql_conn.close()
-            pg_conn.close()
+        assert not too_different, "Counts too different on " + ", ".join(too_different)
 
-    def test_top_pages_match(self):
+    def test_top_pages_match(self, mysql_conn, pg_conn):
         """Verify top pages are similar between both systems."""
-        mysql_conn = get_mysql_connection()
-        pg_conn = get_postgres_connection()
-
-        try:
-            # Test period
-            start_date = datetime(2023, 6, 1)
-            end_date = datetime(2023, 6, 30)
-
-            # Get top pages from Matomo
-            mysql_cur = mysql_conn.cursor()
-            mysql_cur.execute(
-                """
-                SELECT 
-                    SUBSTRING_INDEX(a.name, '/', -1) as page,
-                    COUNT(*) as views
+        # Test period
+        start_date = datetime(2023, 6, 1)
+        end_date = datetime(2023, 6, 30)
+
+        # Get top pages from Matomo
+        mysql_cur = mysql_conn.cursor()
+        mysql_cur.execute(
+            """
+            WITH pageviews AS (
+                SELECT SUBSTRING_INDEX(a.name, '/', -1) as page
                 FROM piwik_log_link_visit_action lva
                 JOIN piwik_log_action a ON lva.idaction_url = a.idaction
                 WHERE lva.idsite = 5
                   AND lva.server_time >= %s
                   AND lva.server_time < %s
                   AND a.type = 1
-                GROUP BY SUBSTRING_INDEX(a.name, '/', -1)
-                ORDER BY views DESC
-                LIMIT 10
-            """,
-                (start_date, end_date),
             )
-            matomo_pages = [row[0] for row in mysql_cur.fetchall()]
-
-            # Get top pages from Umami
-            pg_cur = pg_conn.cursor()
-            pg_cur.execute(
-                """
-                SELECT 
-                    SPLIT_PART(url_path, '/', -1) as page,
-                    COUNT(*) as views
+            SELECT page, COUNT(*) as views
+            FROM pageviews
+            GROUP BY page
+            ORDER BY views DESC
+            LIMIT 10
+        """,
+            (start_date, end_date),
+        )
+        matomo_pages = [row[0] for row in mysql_cur.fetchall()]
+
+        # Get top pages from Umami
+        pg_cur = pg_conn.cursor()
+        pg_cur.execute(
+            """
+            WITH pageviews AS (
+                SELECT SPLIT_PART(url_path, '/', -1) as page
                 FROM website_event
                 WHERE website_id = '3824c584-bc9d-4a9b-aa35-9aa64f797c6f'
                   AND created_at >= %s
                   AND created_at < %s
                   AND event_type = 1
-                GROUP BY SPLIT_PART(url_path, '/', -1)
-                ORDER BY views DESC
-                LIMIT 10
-            """,
-                (start_date, end_date),
             )
-            umami_pages = [row[0] for row in pg_cur.fetchall()]
-
-            # At least some overlap in top pages
-            common_pages = set(matomo_pages) & set(umami_pages)
-            print(f"\nMatomo top pages: {matomo_pages}")
-            print(f"Umami top pages: {umami_pages}")
-            print(f"Common pages: {common_pages}")
+            SELECT page, COUNT(*) as views
+            FROM pageviews
+            GROUP BY page
+            ORDER BY views DESC
+            LIMIT 10
+        """,
+            (start_date, end_date),
+        )
+        umami_pages = [row[0] for row in pg_cur.fetchall()]
 
-            assert len(common_pages) > 0, "No common top pages found"
+        # At least some overlap in top pages
+        common_pages = set(matomo_pages) & set(umami_pages)
+        print(f"\nMatomo top pages: {matomo_pages}")
+        print(f"Umami top pages: {umami_pages}")
+        print(f"Common pages: {common_pages}")
 
-        finally:
-            mysql_conn.close()
-            pg_conn.close()
+        assert len(common_pages) > 0, "No common top pages found"
 
-    def test_browser_distribution_similar(self):
+    def test_browser_distribution_similar(self, mysql_conn, pg_conn):
         """Verify browser distribution is similar."""
-        mysql_conn = get_mysql_connection()
-        pg_conn = get_postgres_connection()
-
-        try:
-            start_date = datetime(2023, 6, 1)
-            end_date = datetime(2023, 6, 30)
-
-            # Matomo browser distribution
-            mysql_cur = mysql_conn.cursor()
-            mysql_cur.execute(
-                """
-                SELECT config_browser_name, COUNT(*) as count
-                FROM piwik_log_visit
-                WHERE idsite = 5
-                  AND visit_first_action_time >= %s
-                  AND visit_first_action_time < %s
-                GROUP BY config_browser_name
-                ORDER BY count DESC
-                LIMIT 5
-            """,
-                (start_date, end_date),
-            )
-            matomo_browsers = mysql_cur.fetchall()
-
-            # Umami browser distribution
-            pg_cur = pg_conn.cursor()
-            pg_cur.execute(
-                """
-                SELECT browser, COUNT(*) as count
-                FROM session
-                WHERE website_id = '3824c584-bc9d-4a9b-aa35-9aa64f797c6f'
-                  AND created_at >= %s
-                  AND created_at < %s
-                GROUP BY browser
-                ORDER BY count DESC
-                LIMIT 5
-            """,
-                (start_date, end_date),
-            )
-            umami_browsers = pg_cur.fetchall()
-
-            print(f"\nMatomo browsers: {matomo_browsers}")
-            print(f"Umami browsers: {umami_browsers}")
+        start_date = datetime(2023, 6, 1)
+        end_date = datetime(2023, 6, 30)
+
+        # Matomo browser distribution
+        mysql_cur = mysql_conn.cursor()
+        mysql_cur.execute(
+            """
+            SELECT config_browser_name, COUNT(*) as count
+            FROM piwik_log_visit
+            WHERE idsite = 5
+              AND visit_first_action_time >= %s
+              AND visit_first_action_time < %s
+            GROUP BY config_browser_name
+            ORDER BY count DESC
+            LIMIT 5
+        """,
+            (start_date, end_date),
+        )
+        matomo_browsers = mysql_cur.fetchall()
+
+        # Umami browser distribution
+        pg_cur = pg_conn.cursor()
+        pg_cur.execute(
+            """
+            SELECT browser, COUNT(*) as count
+            FROM session
+            WHERE website_id = '3824c584-bc9d-4a9b-aa35-9aa64f797c6f'
+              AND created_at >= %s
+              AND created_at < %s
+            GROUP BY browser
+            ORDER BY count DESC
+            LIMIT 5
+        """,
+            (start_date, end_date),
+        )
+        umami_browsers = pg_cur.fetchall()
 
-            # Chrome should be in top 3 for both
-            matomo_top = [b[0] for b in matomo_browsers[:3]]
-            umami_top = [b[0] for b in umami_browsers[:3]]
+        print(f"\nMatomo browsers: {matomo_browsers}")
+        print(f"Umami browsers: {umami_browsers}")
 
-            # CH = Chrome in Matomo, 'chrome' in Umami
-            assert "CH" in matomo_top or "CM" in matomo_top, (
-                "Chrome not in Matomo top browsers"
-            )
-            assert any("chrome" in (b or "").lower() for b in umami_top), (
-                "Chrome not in Umami top browsers"
-            )
+        # Chrome should be in top 3 for both
+        matomo_top = [b[0] for b in matomo_browsers[:3]]
+        umami_top = [b[0] for b in umami_browsers[:3]]
 
-        finally:
-            mysql_conn.close()
-            pg_conn.close()
+        # CH = Chrome in Matomo, 'chrome' in Umami
+        assert "CH" in matomo_top or "CM" in matomo_top, (
+            "Chrome not in Matomo top browsers"
+        )
+        assert any("chrome" in (b or "").lower() for b in umami_top), (
+            "Chrome not in Umami top browsers"
+        )
 
 
 class TestMigrationOutput:
     """Tests for the migration SQL output."""
 
-    def test_generated_sql_valid(self):
+    @requires_mysql
+    @pytest.mark.parametrize("output_format", ["sql", "copy"])
+    def test_generated_sql_valid(self, output_format):
         """Test that generated SQL is syntactically valid."""
         from matomo_to_umami.mappings import SiteMapping
         from matomo_to_umami.migrate import MatomoToUmamiMigrator
 
-        mysql_conn = get_mysql_connection()
-
-        try:
-            migrator = MatomoToUmamiMigrator(
-                mysql_host=MYSQL_HOST,
-                mysql_port=MYSQL_PORT,
-                site_mappings=[
-                    SiteMapping(
-                        5, "3824c584-bc9d-4a9b-aa35-9aa64f797c6f", "stanislas.blog"
-                    ),
-                ],
-                batch_size=10,
-            )
-            migrator.connect()
-
-            # Generate SQL for a small date range
-            start_date = datetime(2023, 6, 1)
-            end_date = datetime(2023, 6, 2)
+        migrator = MatomoToUmamiMigrator(
+            mysql_host=MYSQL_HOST,
+            mysql_port=MYSQL_PORT,
+            site_mappings=[
+                SiteMapping(
+                    5, "3824c584-bc9d-4a9b-aa35-9aa64f797c6f", "stanislas.blog"
+                ),
+            ],
+            batch_size=10,
+            output_format=output_format,
+        )
+        migrator.connect()
 
-            sql_lines = list(migrator.generate_sessions_sql(start_date, end_date))
+        # Generate SQL for a small date range
+        start_date = datetime(2023, 6, 1)
+        end_date = datetime(2023, 6, 2)
 
-            # Should have some output
-            assert len(sql_lines) > 0
+        # Only read the head of the stream: the generator must not need to
+        # be run to the end
+        sql_lines = list(
+            islice(migrator.generate_sessions_sql(start_date, end_date), 50)
+        )
 
+        # Should have some output
+        assert len(sql_lines) > 0
+
+        if migrator.output_format == "copy":
+            # Should contain COPY blocks into the staging table
+            batches = [line for line in sql_lines if line.startswith("COPY session")]
+            assert batches
+            # Rows are batched, between the COPY line and the \. terminator
+            assert any(len(batch.splitlines()) > 3 for batch in batches)
+            quote = '"'
+        else:
             # Should contain INSERT statements
-            sql_text = "\n".join(sql_lines)
-            assert "INSERT INTO session" in sql_text
-
-            # Should have valid UUIDs
-            assert "'" in sql_text  # Quoted values
+            batches = [
+                line for line in sql_lines if line.startswith("INSERT INTO session")
+            ]
+            assert batches
+            # Rows are batched into multi-row VALUES lists
+            assert any("),(" in batch for batch in batches)
+            quote = "'"
 
-            migrator.close()
+        # Should have valid UUIDs
+        assert quote in "\n".join(batches)  # Quoted values
 
-        finally:
-            mysql_conn.close()
+        migrator.close()
 
     def test_uuid_consistency(self):
         """Test that UUIDs are consistent across runs."""
@@ -344,3 +368,102 @@ class TestMigrationOutput:
         # Different visits should have different UUIDs
         uuid3 = generate_uuid_from_matomo_id(1412531, "visit")
         assert uuid1 != uuid3
+
+
+class TestCompressedWriter:
+    """Tests for zstd-compressed output."""
+
+    def test_round_trip(self, tmp_path):
+        from matomo_to_umami.migrate import CompressedWriter
+
+        zstd = pytest.importorskip("compression.zstd")
+        path = tmp_path / "out.sql.zst"
+        writer = CompressedWriter(open(path, "wb"))
+        # Spans several chunks so the background thread is exercised
+        lines = [f"INSERT INTO t VALUES ({i}, 'é');\n" for i in range(100_000)]
+        for line in lines:
+            writer.write(line)
+        writer.close()
+        assert zstd.decompress(path.read_bytes()).decode() == "".join(lines)
+
+    def test_close_closes_file_after_write_error(self):
+        from matomo_to_umami.migrate import CompressedWriter
+
+        pytest.importorskip("compression.zstd")
+
+        class FullDisk(io.BytesIO):
+            def write(self, data):
+                raise OSError(errno.ENOSPC, "No space left on device")
+
+        raw = FullDisk()
+        writer = CompressedWriter(raw)
+        # Keep writing until the compression thread's error surfaces, then
+        # close as generate_migration_sql's cleanup does
+        with pytest.raises(OSError):
+            while True:
+                writer.write("x" * CompressedWriter.CHUNK_SIZE)
+        with pytest.raises(OSError) as excinfo:
+            writer.close()
+        assert excinfo.value.errno == errno.ENOSPC
+        assert raw.closed
+
+
+class TestParallelMigration:
+    """Tests for the one-worker-per-site migration."""
+
+    def test_duplicate_site_mapping_runs_once(self, tmp_path, monkeypatch):
+        from matomo_to_umami import migrate
+        from matomo_to_umami.mappings import SiteMapping
+        from matomo_to_umami.migrate import MatomoToUmamiMigrator
+
+        calls = []
+
+        def fake_shard(*, site_mapping, output_file, **kwargs):
+            calls.append(site_mapping)
+            shard = Path(output_file)
+            assert not shard.exists()
+            shard.write_text(f"-- site {site_mapping.matomo_idsite}\n")
+
+        monkeypatch.setattr(migrate, "ProcessPoolExecutor", ThreadPoolExecutor)
+        monkeypatch.setattr(migrate, "_migrate_site_shard", fake_shard)
+        site_a = SiteMapping(1, "a5d41854-bde7-4416-819f-3923ea2b2706", "a.example")
+        site_b = SiteMapping(2, "3824c584-bc9d-4a9b-aa35-9aa64f797c6f", "b.example")
+        site_a_again = SiteMapping(1, "a5d41854-bde7-4416-819f-3923ea2b2706", "a.test")
+        migrator = MatomoToUmamiMigrator(site_mappings=[site_a, site_b, site_a_again])
+
+        output = tmp_path / "out.sql"
+        migrator.generate_migration_sql_parallel(str(output), jobs=3)
+
+        # Last mapping wins, as with the sequential path's site lookup
+        assert sorted(calls, key=lambda m: m.matomo_idsite) == [site_a_again, site_b]
+        assert output.read_text() == "-- site 1\n-- site 2\n"
+        assert list(tmp_path.iterdir()) == [output]
+
+    def test_stale_shard_of_site_without_data_is_not_merged(
+        self, tmp_path, monkeypatch
+    ):
+        from matomo_to_umami import migrate
+        from matomo_to_umami.mappings import SiteMapping
+        from matomo_to_umami.migrate import MatomoToUmamiMigrator
+
+        def fake_shard(*, site_mapping, output_file, **kwargs):
+            # Site 2 has no rows in the range, so writes no shard
+            if site_mapping.matomo_idsite == 1:
+                Path(output_file).write_text("-- site 1\n")
+
+        monkeypatch.setattr(migrate, "ProcessPoolExecutor", ThreadPoolExecutor)
+        monkeypatch.setattr(migrate, "_migrate_site_shard", fake_shard)
+        migrator = MatomoToUmamiMigrator(
+            site_mappings=[
+                SiteMapping(1, "a5d41854-bde7-4416-819f-3923ea2b2706", "a.example"),
+                SiteMapping(2, "3824c584-bc9d-4a9b-aa35-9aa64f797c6f", "b.example"),
+            ]
+        )
+
+        output = tmp_path / "out.sql"
+        # Left behind by an earlier run that was killed before cleaning up
+        (tmp_path / "out.sql.2.part").write_text("-- stale site 2\n")
+        migrator.generate_migration_sql_parallel(str(output), jobs=2)
+
+        assert output.read_text() == "-- site 1\n"
+        assert list(tmp_path.iterdir()) == [output]